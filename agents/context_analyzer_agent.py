@@ -9,14 +9,99 @@ This agent is self-sufficient - it reads all necessary data directly from:
 - API request (conversation history via kwargs)
 """
 import logging
-import json
 import os
-import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from agents.basic_agent import BasicAgent
+from utils.tokenizer import VECTORIZE_MIN_ITEMS, get_default_tokenizer, structured_length
+
+try:
+    from utils.storage_factory import get_storage_manager as _get_storage
+except ImportError:
+    _get_storage = None
+
+_AGENTS_DIR = os.path.dirname(os.path.abspath(__file__))
+_AGENT_SUFFIX = '_agent.py'
+
+# Static display strings, built once
+_SEP = "  " + "─" * 57
+_HDR_USAGE = "  Context Usage"
+_HDR_AGENTS = "  Agent Tools · /agents"
+_HDR_MEM = "  Memory · /memory"
+_HDR_MSGS = "  Messages"
+
+# Agent listings rarely change within a session; reuse them for a short TTL
+_AGENT_CACHE_TTL = 60
+_AGENT_CACHE = {'key': None, 'value': None, 'ts': 0.0}
+_STORAGE_LIST_CACHE = {}  # directory name -> (timestamp, files)
+
+
+def _fmt_tokens(n):
+    """Format a token count, e.g. 1500 -> '1.5k'"""
+    if n >= 1000:
+        return f"{n/1000:.1f}k"
+    return str(int(n))
+
+
+def _fmt_pct(n, inv):
+    """Format n as a percentage, where inv is 100 / max_tokens"""
+    return f"{n * inv:.1f}%"
+
+
+def _list_storage_files(storage, directory_name):
+    """List files in a storage directory, cached for _AGENT_CACHE_TTL seconds"""
+    now = time.monotonic()
+    cached = _STORAGE_LIST_CACHE.get(directory_name)
+    if cached and now - cached[0] < _AGENT_CACHE_TTL:
+        return cached[1]
+    try:
+        files = list(storage.list_files(directory_name))
+    except Exception:
+        _STORAGE_LIST_CACHE.pop(directory_name, None)
+        raise
+    _STORAGE_LIST_CACHE[directory_name] = (now, files)
+    return files
+
+
+@dataclass(slots=True)
+class ContextSnapshot:
+    """Per-request context usage figures, filled in place by the analyzer helpers"""
+    model_name: str = ''
+    max_tokens: int = 0
+    api_version: str = ''
+    sys_tokens: int = 0
+    tool_tokens: int = 0
+    mem_tokens: int = 0
+    msg_tokens: int = 0
+    user_count: int = 0
+    assistant_count: int = 0
+    total_msgs: int = 0
+    memory_length: int = 0
+    has_memory: bool = False
+    summary: bool = False
+    local_agents: list = field(default_factory=list)
+    storage_agents: list = field(default_factory=list)
 
 
 class ContextAnalyzerAgent(BasicAgent):
-    def __init__(self):
+    # Model token limits lookup
+    model_token_limits = {
+        'gpt-5-chat': 200000,
+        'gpt-5': 200000,
+        'gpt-4o': 128000,
+        'gpt-4-turbo': 128000,
+        'gpt-4': 8192,
+        'gpt-4-32k': 32768,
+        'gpt-35-turbo': 16385,
+        'gpt-35-turbo-16k': 16385,
+    }
+
+    # Substring fallback, longest key first so e.g. 'gpt-4-32k' isn't shadowed by 'gpt-4'
+    _MODEL_LIMITS = tuple(sorted(model_token_limits.items(), key=lambda kv: -len(kv[0])))
+
+    def __init__(self, tokenizer=None):
         self.name = 'ContextAnalyzer'
         self.metadata = {
             "name": self.name,
@@ -27,6 +112,11 @@ class ContextAnalyzerAgent(BasicAgent):
                     "user_guid": {
                         "type": "string",
                         "description": "User GUID for memory lookup (optional, auto-detected from request)"
+                    },
+                    "detail": {
+                        "type": "string",
+                        "enum": ["summary", "full"],
+                        "description": "'summary' shows only the usage bar and skips storage lookups (fast); 'full' adds agent, memory and message listings (default)"
                     }
                 },
                 "required": []
@@ -34,147 +124,176 @@ class ContextAnalyzerAgent(BasicAgent):
         }
         super().__init__(name=self.name, metadata=self.metadata)
 
-        # Model token limits lookup
-        self.model_token_limits = {
-            'gpt-5-chat': 200000,
-            'gpt-5': 200000,
-            'gpt-4o': 128000,
-            'gpt-4-turbo': 128000,
-            'gpt-4': 8192,
-            'gpt-4-32k': 32768,
-            'gpt-35-turbo': 16385,
-            'gpt-35-turbo-16k': 16385,
-        }
+        # Exact counts via tiktoken when installed, else a calibrated chars-per-token estimate
+        self.tokenizer = tokenizer or get_default_tokenizer(os.environ.get('AZURE_OPENAI_DEPLOYMENT_NAME'))
 
     def perform(self, **kwargs):
         """
         Analyzes context usage by gathering data from multiple sources automatically.
+
+        detail='summary' skips the storage agent scan and memory lookup so it
+        returns in well under a millisecond; detail='full' (default) may take
+        hundreds of milliseconds against Azure storage.
         """
         # Extract conversation history from kwargs (passed via API request)
         conversation_history = kwargs.get('conversation_history', [])
         user_guid = kwargs.get('user_guid')
+        summary = kwargs.get('detail', 'full') == 'summary'
 
-        # Gather all data deterministically
-        model_info = self._get_model_info()
-        agent_info = self._get_agent_info()
-        memory_info = self._get_memory_info(user_guid)
-        system_prompt_info = self._get_system_prompt_info()
-        message_info = self._analyze_messages(conversation_history)
-
-        # Calculate token estimates
-        token_counts = {
-            'system_prompt': system_prompt_info['estimated_tokens'],
-            'agent_tools': agent_info['estimated_tokens'],
-            'memory': memory_info['estimated_tokens'],
-            'messages': message_info['estimated_tokens'],
-            'user_messages': message_info['user_count'],
-            'assistant_messages': message_info['assistant_count'],
-            'total_messages': message_info['total_count']
-        }
+        snap = ContextSnapshot(summary=summary)
+        self._get_model_info(snap)
 
-        # Generate visual output
-        return self._generate_context_display(
-            token_counts,
-            model_info['max_tokens'],
-            model_info['model_name'],
-            agent_info,
-            memory_info
-        )
-
-    def _get_model_info(self):
-        """Get model configuration from environment variables"""
-        deployment_name = os.environ.get('AZURE_OPENAI_DEPLOYMENT_NAME', 'gpt-5-chat')
+        if summary:
+            # Local agents only (cached); no storage round-trips
+            self._get_agent_info(snap)
+            self._get_system_prompt_info(snap)
+        else:
+            # One storage manager shared by the agent and memory lookups, which
+            # are independent storage round-trips and run concurrently
+            storage = self._get_storage()
+            if storage is not None and user_guid:
+                # Switch to the user's memory before either lookup starts, so
+                # neither sees the manager's paths change underneath it
+                try:
+                    storage.set_memory_context(user_guid)
+                except Exception as e:
+                    logging.debug(f"Could not set memory context: {e}")
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                futures = (
+                    executor.submit(self._get_agent_info, snap, storage),
+                    executor.submit(self._get_memory_info, snap, storage),
+                )
+                self._get_system_prompt_info(snap)
+                for future in futures:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logging.warning(f"Context lookup failed: {e}")
+
+        self._analyze_messages(snap, conversation_history)
 
-        # Determine max tokens based on model
-        max_tokens = self.model_token_limits.get(deployment_name, 200000)
+        # Generate visual output
+        return self._generate_context_display(snap)
 
-        # Check for common model name patterns
-        for model_key, limit in self.model_token_limits.items():
-            if model_key in deployment_name.lower():
-                max_tokens = limit
-                break
+    def _get_storage(self):
+        """Create the storage manager, or None if storage is unavailable"""
+        if _get_storage is None:
+            return None
+        try:
+            return _get_storage()
+        except Exception as e:
+            logging.debug(f"Could not create storage manager: {e}")
+            return None
 
-        return {
-            'model_name': deployment_name,
-            'max_tokens': max_tokens,
-            'api_version': os.environ.get('AZURE_OPENAI_API_VERSION', 'unknown')
-        }
+    def _get_model_info(self, snap):
+        """Get model configuration from environment variables"""
+        deployment_name = os.environ.get('AZURE_OPENAI_DEPLOYMENT_NAME', 'gpt-5-chat')
 
-    def _get_agent_info(self):
+        # Determine max tokens based on model: exact match first, then common name patterns
+        name_lc = deployment_name.lower()
+        max_tokens = self.model_token_limits.get(name_lc)
+        if max_tokens is None:
+            max_tokens = 200000
+            for model_key, limit in self._MODEL_LIMITS:
+                if model_key in name_lc:
+                    max_tokens = limit
+                    break
+
+        snap.model_name = deployment_name
+        snap.max_tokens = max_tokens
+        snap.api_version = os.environ.get('AZURE_OPENAI_API_VERSION', 'unknown')
+
+    def _get_agent_info(self, snap, storage=None):
         """Scan agents directory and storage to enumerate available agents"""
-        agents = []
+        try:
+            cache_key = os.stat(_AGENTS_DIR).st_mtime_ns
+        except OSError:
+            cache_key = None
+        # A cached full listing also serves storage-less (summary) calls
+        if (cache_key is not None and _AGENT_CACHE['key'] == cache_key
+                and time.monotonic() - _AGENT_CACHE['ts'] < _AGENT_CACHE_TTL):
+            snap.local_agents, snap.storage_agents, snap.tool_tokens = _AGENT_CACHE['value']
+            return
+
+        seen = set()  # agent file names already listed
+        local_agents = []
+        storage_agents = []
         estimated_tokens = 0
 
         # Scan local agents directory
         try:
-            agents_dir = os.path.join(os.path.dirname(__file__), '.')
-            if os.path.exists(agents_dir):
-                for file in os.listdir(agents_dir):
-                    if file.endswith('_agent.py') and file != 'basic_agent.py':
-                        agent_name = file.replace('_agent.py', '').replace('_', ' ').title()
-                        agents.append({
+            if os.path.isdir(_AGENTS_DIR):
+                with os.scandir(_AGENTS_DIR) as entries:
+                    for entry in entries:
+                        file = entry.name
+                        if not file.endswith(_AGENT_SUFFIX) or file == 'basic_agent.py' or not entry.is_file():
+                            continue
+                        agent_name = file[:-len(_AGENT_SUFFIX)].replace('_', ' ').title()
+                        agent = {
                             'name': agent_name,
                             'file': file,
                             'source': 'local'
-                        })
+                        }
+                        seen.add(file)
+                        local_agents.append(agent)
                         # Estimate ~500 tokens per agent for function metadata
                         estimated_tokens += 500
         except Exception as e:
             logging.warning(f"Could not scan local agents: {e}")
 
         # Try to scan Azure storage agents
-        try:
-            from utils.storage_factory import get_storage_manager
-            storage = get_storage_manager()
-            storage_agents = storage.list_files('agents')
-            for file in storage_agents:
-                if file.name.endswith('_agent.py'):
-                    agent_name = file.name.replace('_agent.py', '').replace('_', ' ').title()
-                    # Avoid duplicates
-                    if not any(a['file'] == file.name for a in agents):
-                        agents.append({
-                            'name': agent_name,
-                            'file': file.name,
-                            'source': 'storage'
-                        })
-                        estimated_tokens += 500
-        except Exception as e:
-            logging.debug(f"Could not scan storage agents: {e}")
-
-        return {
-            'agents': agents,
-            'count': len(agents),
-            'estimated_tokens': estimated_tokens
-        }
-
-    def _get_memory_info(self, user_guid=None):
-        """Read memory content size from storage"""
-        memory_content = ""
+        if storage is not None:
+            try:
+                for file in _list_storage_files(storage, 'agents'):
+                    if file.name.endswith(_AGENT_SUFFIX):
+                        agent_name = file.name[:-len(_AGENT_SUFFIX)].replace('_', ' ').title()
+                        # Avoid duplicates
+                        if file.name not in seen:
+                            seen.add(file.name)
+                            agent = {
+                                'name': agent_name,
+                                'file': file.name,
+                                'source': 'storage'
+                            }
+                            storage_agents.append(agent)
+                            estimated_tokens += 500
+            except Exception as e:
+                logging.debug(f"Could not scan storage agents: {e}")
+
+        snap.local_agents = local_agents
+        snap.storage_agents = storage_agents
+        snap.tool_tokens = estimated_tokens
+        if storage is not None:
+            _AGENT_CACHE.update(key=cache_key, value=(local_agents, storage_agents, estimated_tokens),
+                                ts=time.monotonic())
+
+    def _get_memory_info(self, snap, storage=None):
+        """Estimate memory size of storage's current memory context (no download)"""
+        content_length = 0
         estimated_tokens = 0
 
-        try:
-            from utils.storage_factory import get_storage_manager
-            storage = get_storage_manager()
-
-            # Set context for user-specific memory
-            if user_guid:
-                storage.set_memory_context(user_guid)
-
-            # Read memory JSON
-            memory_data = storage.read_json()
-            if memory_data:
-                memory_content = json.dumps(memory_data)
-                estimated_tokens = max(1, len(memory_content) // 4)
-        except Exception as e:
-            logging.debug(f"Could not read memory: {e}")
-
-        return {
-            'content_length': len(memory_content),
-            'estimated_tokens': estimated_tokens,
-            'has_memory': estimated_tokens > 0
-        }
-
-    def _get_system_prompt_info(self):
+        if storage is not None:
+            try:
+                get_memory_size = getattr(storage, 'get_memory_size', None)
+                if get_memory_size is not None:
+                    # An empty memory file holds just "{}"
+                    content_length = get_memory_size()
+                    if content_length > 2:
+                        estimated_tokens = max(1, content_length // 4)
+                else:
+                    # Older storage managers only offer read_json; measure without re-serializing
+                    memory_data = storage.read_json()
+                    if memory_data:
+                        content_length = structured_length(memory_data)
+                        estimated_tokens = max(1, content_length // 4)
+            except Exception as e:
+                logging.debug(f"Could not read memory: {e}")
+
+        snap.memory_length = content_length
+        snap.mem_tokens = estimated_tokens
+        snap.has_memory = estimated_tokens > 0
+
+    def _get_system_prompt_info(self, snap):
         """Reconstruct system prompt size from environment config"""
         assistant_name = os.environ.get('ASSISTANT_NAME', 'BusinessInsightBot')
         characteristic = os.environ.get('CHARACTERISTIC_DESCRIPTION', 'helpful business assistant')
@@ -186,192 +305,175 @@ class ContextAnalyzerAgent(BasicAgent):
         char_tokens = len(characteristic) // 4
 
         # Add estimate for agent instructions and formatting
-        total_estimate = base_prompt_estimate + name_tokens + char_tokens
+        snap.sys_tokens = base_prompt_estimate + name_tokens + char_tokens
 
-        return {
-            'assistant_name': assistant_name,
-            'characteristic': characteristic,
-            'estimated_tokens': total_estimate
-        }
-
-    def _analyze_messages(self, conversation_history):
+    def _analyze_messages(self, snap, conversation_history):
         """Analyze conversation history for token usage"""
+        # History arrives as parsed JSON, so exact type checks are safe and cheaper than isinstance
+        tokenizer = self.tokenizer
         total_tokens = 0
-        user_count = 0
-        assistant_count = 0
-
-        for msg in conversation_history:
-            if isinstance(msg, dict):
-                content = msg.get('content', '')
-                role = msg.get('role', '')
-
-                # Estimate tokens (~4 chars per token)
-                if isinstance(content, str):
-                    total_tokens += max(1, len(content) // 4)
-                elif isinstance(content, (dict, list)):
-                    total_tokens += max(1, len(json.dumps(content)) // 4)
-
-                # Add overhead for message structure
-                total_tokens += 4  # role, separators
-
-                if role == 'user':
-                    user_count += 1
-                elif role == 'assistant':
-                    assistant_count += 1
-
-        return {
-            'estimated_tokens': total_tokens,
-            'user_count': user_count,
-            'assistant_count': assistant_count,
-            'total_count': len(conversation_history)
-        }
+        count_lengths = getattr(tokenizer, 'count_lengths', None)
+
+        if count_lengths is not None and len(conversation_history) >= VECTORIZE_MIN_ITEMS:
+            # Length-based estimators can sum long histories in one vectorized pass
+            lengths = []
+            for msg in conversation_history:
+                if type(msg) is dict:
+                    content = msg.get('content', '')
+                    t = type(content)
+                    if t is str:
+                        lengths.append(len(content))
+                    elif t is dict or t is list:
+                        lengths.append(structured_length(content))
+                    total_tokens += 4  # role, separators
+            total_tokens += count_lengths(lengths)
+        else:
+            for msg in conversation_history:
+                if type(msg) is dict:
+                    content = msg.get('content', '')
+
+                    t = type(content)
+                    if t is str:
+                        total_tokens += tokenizer.count_text(content)
+                    elif t is dict or t is list:
+                        total_tokens += tokenizer.count_structured(content)
+
+                    # Add overhead for message structure
+                    total_tokens += 4  # role, separators
 
-    def _generate_context_display(self, token_counts, max_tokens, model_name, agent_info, memory_info):
+        role_counts = Counter(msg.get('role') for msg in conversation_history if type(msg) is dict)
+
+        snap.msg_tokens = total_tokens
+        snap.user_count = role_counts['user']
+        snap.assistant_count = role_counts['assistant']
+        snap.total_msgs = len(conversation_history)
+
+    def _generate_context_display(self, snap):
         """Generate a visual context usage display similar to Claude Code's /context"""
+        return "\n".join(self._iter_context_display(snap))
+
+    def _iter_context_display(self, snap):
+        """Yield the context display line by line, for callers that stream output"""
+        max_tokens = snap.max_tokens
 
         # Calculate totals
-        used_tokens = (
-            token_counts['system_prompt'] +
-            token_counts['agent_tools'] +
-            token_counts['memory'] +
-            token_counts['messages']
-        )
+        used_tokens = snap.sys_tokens + snap.tool_tokens + snap.mem_tokens + snap.msg_tokens
 
         free_tokens = max(0, max_tokens - used_tokens)
         buffer_tokens = int(max_tokens * 0.15)
         effective_free = max(0, free_tokens - buffer_tokens)
-        usage_percent = (used_tokens / max_tokens) * 100 if max_tokens > 0 else 0
-
-        # Format helpers
-        def fmt_tokens(n):
-            if n >= 1000:
-                return f"{n/1000:.1f}k"
-            return str(int(n))
-
-        def fmt_pct(n):
-            pct = (n / max_tokens) * 100 if max_tokens > 0 else 0
-            return f"{pct:.1f}%"
+        # Single guard for every percentage below
+        inv = (100.0 / max_tokens) if max_tokens > 0 else 0.0
+        usage_percent = used_tokens * inv
 
         # Create visual block bar (like Claude Code) - 10 blocks per row, 4 rows
         def make_visual_grid(percentages):
             """Create a 4-row visual grid showing token allocation"""
             total_blocks = 40
-            rows = []
-
-            # Calculate blocks for each category
-            blocks = []
-            for pct in percentages:
-                num_blocks = int((pct / 100) * total_blocks)
-                blocks.append(num_blocks)
-
-            # Ensure we don't exceed total
-            while sum(blocks) > total_blocks:
-                max_idx = blocks.index(max(blocks))
-                blocks[max_idx] -= 1
-
-            # Build the grid string
-            all_blocks = []
             colors = ['🟦', '🟧', '🟩', '🟨', '⬜', '⬛']  # sys, tools, mem, msg, free, buffer
 
-            for i, count in enumerate(blocks):
-                all_blocks.extend([colors[i]] * count)
-
-            # Pad with buffer/free
-            remaining = total_blocks - len(all_blocks)
-            buffer_blocks = min(remaining, int(total_blocks * 0.15))
-            free_blocks = remaining - buffer_blocks
-            all_blocks.extend(['⬜'] * free_blocks)
-            all_blocks.extend(['⬛'] * buffer_blocks)
-
-            # Format into 4 rows of 10
-            for i in range(4):
-                start = i * 10
-                rows.append(''.join(all_blocks[start:start + 10]))
-
-            return rows
+            # Largest-remainder apportionment of the 40 blocks across categories
+            scale = total_blocks / max(100.0, sum(percentages))
+            raw = [pct * scale for pct in percentages]
+            blocks = [int(x) for x in raw]
+            leftover = total_blocks - sum(blocks)
+            if leftover > 0:
+                by_remainder = sorted(range(len(raw)), key=lambda i: raw[i] - blocks[i], reverse=True)
+                for i in by_remainder[:leftover]:
+                    if raw[i] > blocks[i]:
+                        blocks[i] += 1
+
+            # One list cell per block (emoji are multi-codepoint, so never slice the joined string)
+            cells = []
+            for color, count in zip(colors, blocks):
+                cells.extend([color] * count)
+            cells.extend(['⬜'] * (total_blocks - len(cells)))
+
+            return [''.join(cells[i * 10:(i + 1) * 10]) for i in range(4)]
 
         # Calculate percentages
-        sys_pct = (token_counts['system_prompt'] / max_tokens) * 100 if max_tokens > 0 else 0
-        tools_pct = (token_counts['agent_tools'] / max_tokens) * 100 if max_tokens > 0 else 0
-        mem_pct = (token_counts['memory'] / max_tokens) * 100 if max_tokens > 0 else 0
-        msg_pct = (token_counts['messages'] / max_tokens) * 100 if max_tokens > 0 else 0
-        free_pct = (effective_free / max_tokens) * 100 if max_tokens > 0 else 0
-        buffer_pct = (buffer_tokens / max_tokens) * 100 if max_tokens > 0 else 0
-
-        grid_rows = make_visual_grid([sys_pct, tools_pct, mem_pct, msg_pct, free_pct, buffer_pct])
+        grid_rows = make_visual_grid([
+            snap.sys_tokens * inv,
+            snap.tool_tokens * inv,
+            snap.mem_tokens * inv,
+            snap.msg_tokens * inv,
+            effective_free * inv,
+            buffer_tokens * inv,
+        ])
 
         # Build output
-        lines = []
-        lines.append("")
-        lines.append("  Context Usage")
-        lines.append("  ─────────────────────────────────────────────────────────")
-        lines.append(f"        {grid_rows[0]}    {model_name} · {fmt_tokens(used_tokens)}/{fmt_tokens(max_tokens)} tokens ({usage_percent:.0f}%)")
-        lines.append(f"        {grid_rows[1]}")
-        lines.append(f"        {grid_rows[2]}")
-        lines.append(f"        {grid_rows[3]}")
-        lines.append("")
+        yield ""
+        yield _HDR_USAGE
+        yield _SEP
+        yield f"        {grid_rows[0]}    {snap.model_name} · {_fmt_tokens(used_tokens)}/{_fmt_tokens(max_tokens)} tokens ({usage_percent:.0f}%)"
+        yield f"        {grid_rows[1]}"
+        yield f"        {grid_rows[2]}"
+        yield f"        {grid_rows[3]}"
+        yield ""
 
         # Breakdown table
-        lines.append(f"        🟦 System prompt:    {fmt_tokens(token_counts['system_prompt']):>7} tokens ({fmt_pct(token_counts['system_prompt']):>5})")
-        lines.append(f"        🟧 Agent tools:      {fmt_tokens(token_counts['agent_tools']):>7} tokens ({fmt_pct(token_counts['agent_tools']):>5})")
-        lines.append(f"        🟩 Memory files:     {fmt_tokens(token_counts['memory']):>7} tokens ({fmt_pct(token_counts['memory']):>5})")
-        lines.append(f"        🟨 Messages:         {fmt_tokens(token_counts['messages']):>7} tokens ({fmt_pct(token_counts['messages']):>5})")
-        lines.append(f"        ⬜ Free space:       {fmt_tokens(effective_free):>7} ({fmt_pct(effective_free):>5})")
-        lines.append(f"        ⬛ Buffer reserve:   {fmt_tokens(buffer_tokens):>7} ({fmt_pct(buffer_tokens):>5})")
-        lines.append("")
+        yield f"        🟦 System prompt:    {_fmt_tokens(snap.sys_tokens):>7} tokens ({_fmt_pct(snap.sys_tokens, inv):>5})"
+        yield f"        🟧 Agent tools:      {_fmt_tokens(snap.tool_tokens):>7} tokens ({_fmt_pct(snap.tool_tokens, inv):>5})"
+        yield f"        🟩 Memory files:     {_fmt_tokens(snap.mem_tokens):>7} tokens ({_fmt_pct(snap.mem_tokens, inv):>5})"
+        yield f"        🟨 Messages:         {_fmt_tokens(snap.msg_tokens):>7} tokens ({_fmt_pct(snap.msg_tokens, inv):>5})"
+        yield f"        ⬜ Free space:       {_fmt_tokens(effective_free):>7} ({_fmt_pct(effective_free, inv):>5})"
+        yield f"        ⬛ Buffer reserve:   {_fmt_tokens(buffer_tokens):>7} ({_fmt_pct(buffer_tokens, inv):>5})"
+        yield ""
+
+        if snap.summary:
+            yield "  Summary view · memory not measured; use detail='full' for the breakdown"
+            yield ""
+            return
 
         # Agent tools section
-        lines.append("  Agent Tools · /agents")
-        lines.append("  ─────────────────────────────────────────────────────────")
-
-        if agent_info['agents']:
-            local_agents = [a for a in agent_info['agents'] if a['source'] == 'local']
-            storage_agents = [a for a in agent_info['agents'] if a['source'] == 'storage']
+        yield _HDR_AGENTS
+        yield _SEP
 
+        local_agents = snap.local_agents
+        storage_agents = snap.storage_agents
+        if local_agents or storage_agents:
             for agent in local_agents[:6]:
-                lines.append(f"  ├─ {agent['name']}: ~500 tokens")
+                yield f"  ├─ {agent['name']}: ~500 tokens"
             if len(local_agents) > 6:
-                lines.append(f"  ├─ ... and {len(local_agents) - 6} more local agents")
+                yield f"  ├─ ... and {len(local_agents) - 6} more local agents"
 
             if storage_agents:
-                lines.append(f"  │")
+                yield f"  │"
                 for agent in storage_agents[:3]:
-                    lines.append(f"  ├─ {agent['name']} (cloud): ~500 tokens")
+                    yield f"  ├─ {agent['name']} (cloud): ~500 tokens"
                 if len(storage_agents) > 3:
-                    lines.append(f"  ├─ ... and {len(storage_agents) - 3} more cloud agents")
+                    yield f"  ├─ ... and {len(storage_agents) - 3} more cloud agents"
 
-            lines.append(f"  └─ Total: {fmt_tokens(token_counts['agent_tools'])} tokens")
+            yield f"  └─ Total: {_fmt_tokens(snap.tool_tokens)} tokens"
         else:
-            lines.append("  └─ No agents loaded")
-        lines.append("")
+            yield "  └─ No agents loaded"
+        yield ""
 
         # Memory section
-        lines.append("  Memory · /memory")
-        lines.append("  ─────────────────────────────────────────────────────────")
-        if memory_info['has_memory']:
-            lines.append(f"  └─ User memory: {fmt_tokens(token_counts['memory'])} tokens")
+        yield _HDR_MEM
+        yield _SEP
+        if snap.has_memory:
+            yield f"  └─ User memory: {_fmt_tokens(snap.mem_tokens)} tokens"
         else:
-            lines.append("  └─ No memory loaded")
-        lines.append("")
+            yield "  └─ No memory loaded"
+        yield ""
 
         # Messages section
-        lines.append("  Messages")
-        lines.append("  ─────────────────────────────────────────────────────────")
-        lines.append(f"  ├─ 👤 User messages:      {token_counts['user_messages']}")
-        lines.append(f"  ├─ 🤖 Assistant messages: {token_counts['assistant_messages']}")
-        lines.append(f"  └─ Total: {token_counts['total_messages']} messages · {fmt_tokens(token_counts['messages'])} tokens")
-        lines.append("")
+        yield _HDR_MSGS
+        yield _SEP
+        yield f"  ├─ 👤 User messages:      {snap.user_count}"
+        yield f"  ├─ 🤖 Assistant messages: {snap.assistant_count}"
+        yield f"  └─ Total: {snap.total_msgs} messages · {_fmt_tokens(snap.msg_tokens)} tokens"
+        yield ""
 
         # Warning if needed
         if usage_percent > 75:
-            lines.append("  ─────────────────────────────────────────────────────────")
+            yield _SEP
             if usage_percent > 90:
-                lines.append("  ⚠️  Critical: Context nearly full! Consider clearing history.")
+                yield "  ⚠️  Critical: Context nearly full! Consider clearing history."
             else:
-                lines.append("  ⚠️  Warning: Context usage is high.")
-            lines.append("")
-
-        return "\n".join(lines)
+                yield "  ⚠️  Warning: Context usage is high."
+            yield ""
 
 
 # For testing
@@ -1,9 +1,390 @@
 from agents.basic_agent import BasicAgent
+from utils.azure_clients import get_cs_client, get_subscription_id, get_web_client
+import contextlib
+import functools
 import logging
 import json
 import os
+import shutil
 import subprocess
-import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Resolve the az CLI once instead of searching PATH (and, on Windows, going
+# through the az.cmd shim lookup) on every call
+_AZ_BIN = shutil.which('az') or 'az'
+
+# Don't allocate a console window for each az call on Windows
+_SUBPROCESS_KWARGS = {'creationflags': subprocess.CREATE_NO_WINDOW} if os.name == 'nt' else {}
+
+# Most az stderr ever kept for an error message (bytes)
+_STDERR_LIMIT = 4096
+
+# Upper bound on concurrent ARM/CLI calls when fanning out across resources
+_MAX_PARALLEL_CALLS = 8
+
+# Flat projection for `az cognitiveservices account list -o tsv`; each row is
+# zipped with _OPENAI_ACCOUNT_FIELDS into the same dict the SDK path builds
+_OPENAI_ACCOUNT_QUERY = "[?kind=='OpenAI'].[name, location, resourceGroup, properties.endpoint]"
+_OPENAI_ACCOUNT_FIELDS = ('name', 'location', 'resourceGroup', 'endpoint')
+
+def _json_loads(data):
+    """Parse JSON bytes, with orjson when it is installed"""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def _decode(data):
+    """Decode raw CLI output bytes for display"""
+    return data.decode('utf-8', errors='replace')
+
+
+# The signed-in identity rarely changes mid-session, so `az account show` is
+# re-run at most this often (seconds)
+_ACCOUNT_TTL = 5 * 60
+_ACCOUNT_STATE = {'value': None, 'ts': 0.0}
+
+
+def _get_az_account():
+    """
+    Get the Azure CLI's current account (id, name and user), cached for _ACCOUNT_TTL.
+
+    Returns None when the CLI is not logged in. That result is not cached,
+    so an `az login` is picked up on the next call.
+    """
+    now = time.monotonic()
+    if _ACCOUNT_STATE['value'] is not None and now - _ACCOUNT_STATE['ts'] < _ACCOUNT_TTL:
+        return _ACCOUNT_STATE['value']
+
+    result = subprocess.run(
+        [_AZ_BIN, 'account', 'show', '--query', '{id:id, name:name, user:user.name}', '-o', 'json'],
+        capture_output=True, timeout=10, **_SUBPROCESS_KWARGS
+    )
+    if result.returncode != 0:
+        return None
+
+    account = _json_loads(result.stdout)
+    _ACCOUNT_STATE['value'] = account
+    _ACCOUNT_STATE['ts'] = now
+    return account
+
+
+# On-disk cache for slow-changing ARM lookups, shared across processes
+_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.entracopilot', 'iqbooster_cache.json')
+_CACHE_LOCK = threading.Lock()
+_CACHE_STATE = {'mtime': None, 'data': {}}
+
+# Cache lifetimes in seconds
+_ACCOUNTS_TTL = 24 * 60 * 60
+_MODELS_TTL = 6 * 60 * 60
+_DEPLOYMENTS_TTL = 60
+
+
+def _cache_key(operation, *args):
+    """Cache key scoped to the subscription the lookup actually queries"""
+    subscription = get_subscription_id()
+    if not subscription:
+        # No env var or CLI profile to read; ask the CLI which one it uses
+        subscription = (_get_az_account() or {}).get('id') or 'default'
+    return '|'.join((subscription, operation) + args)
+
+
+def _load_cache():
+    """Return the cache contents, re-reading the file only when its mtime changed"""
+    try:
+        mtime = os.stat(_CACHE_PATH).st_mtime_ns
+    except OSError:
+        return {}
+    if mtime != _CACHE_STATE['mtime']:
+        try:
+            with open(_CACHE_PATH, 'r') as f:
+                _CACHE_STATE['data'] = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.debug(f"Ignoring unreadable IQBooster cache: {e}")
+            _CACHE_STATE['data'] = {}
+        _CACHE_STATE['mtime'] = mtime
+    return _CACHE_STATE['data']
+
+
+def _save_cache(data):
+    try:
+        os.makedirs(os.path.dirname(_CACHE_PATH), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(_CACHE_PATH), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, _CACHE_PATH)
+        _CACHE_STATE['data'] = data
+        _CACHE_STATE['mtime'] = os.stat(_CACHE_PATH).st_mtime_ns
+    except OSError as e:
+        logging.debug(f"Could not write IQBooster cache: {e}")
+
+
+def _cached(ttl):
+    """Cache a lookup's JSON-serializable result on disk for ttl seconds"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args):
+            key = _cache_key(func.__name__, *args)
+            with _CACHE_LOCK:
+                entry = _load_cache().get(key)
+            if entry and time.time() - entry['ts'] < ttl:
+                return entry['value']
+
+            value = func(self, *args)
+            with _CACHE_LOCK:
+                data = dict(_load_cache())
+                data[key] = {'ts': time.time(), 'value': value}
+                _save_cache(data)
+            return value
+        return wrapper
+    return decorator
+
+
+def _invalidate_cache(operation, *args):
+    """Drop a cached lookup after a change that makes it stale"""
+    key = _cache_key(operation, *args)
+    with _CACHE_LOCK:
+        data = _load_cache()
+        if key in data:
+            data = dict(data)
+            del data[key]
+            _save_cache(data)
+
+
+# Models auto boost prefers, best first; matched as substrings of the
+# deployed model name so variants like gpt-4o-mini rank with their family
+_PRIORITY_MODELS = ('gpt-5-chat', 'gpt-5', 'gpt-4o', 'gpt-4-turbo', 'gpt-4', 'gpt-35-turbo')
+_PRIORITY_RANK = {model: rank for rank, model in enumerate(_PRIORITY_MODELS)}
+
+
+def _model_rank(model_name):
+    """Rank a model against _PRIORITY_MODELS (lower is better); unlisted models rank last"""
+    model_name = model_name.lower()
+    rank = _PRIORITY_RANK.get(model_name)
+    if rank is not None:
+        return rank
+    # Variants such as gpt-4o-mini: first listed family the name contains
+    return next((rank for rank, model in enumerate(_PRIORITY_MODELS) if model in model_name), len(_PRIORITY_MODELS))
+
+
+@contextlib.contextmanager
+def _app_settings_arg(settings):
+    """
+    Write app settings to a private temp file for `az ... appsettings set`.
+
+    Yields the `@path` value for --settings, which keeps secrets such as the
+    API key out of the process command line. The file is removed on exit.
+    """
+    fd, path = tempfile.mkstemp(suffix='.json')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            # Same shape as `az functionapp config appsettings list`
+            json.dump([{'name': k, 'value': v, 'slotSetting': False} for k, v in settings.items()], f)
+        yield '@' + path
+    finally:
+        os.remove(path)
+
+
+def _read_settings_file(path):
+    """Load a local.settings.json file, or an empty one if it does not exist yet"""
+    if not os.path.exists(path):
+        return {"IsEncrypted": False, "Values": {}}
+    with open(path, 'rb') as f:
+        data = f.read()
+    return _json_loads(data)
+
+
+def _write_settings_file(path, settings):
+    """
+    Write a local.settings.json file with the same 2-space indent as before.
+
+    The data is written to a sibling temp file, synced and renamed over the
+    target, so a crash mid-write leaves the previous settings intact.
+    """
+    if orjson:
+        data = orjson.dumps(settings, option=orjson.OPT_INDENT_2)
+    else:
+        data = json.dumps(settings, indent=2).encode('utf-8')
+
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _update_settings_file(path, updates):
+    """
+    Merge updates into the Values section of a local.settings.json file.
+
+    The file is only rewritten when at least one value actually changes.
+
+    Returns:
+        tuple: (Values as they were before the update, whether the file was written)
+    """
+    settings = _read_settings_file(path)
+    values = settings.setdefault('Values', {})
+    previous = dict(values)
+    if all(values.get(key) == value for key, value in updates.items()):
+        return previous, False
+
+    values.update(updates)
+    _write_settings_file(path, settings)
+    return previous, True
+
+
+# Static Markdown for the tutorial and status views; only the live
+# configuration is formatted per call
+_TUTORIAL_PREFIX = """# 🧠 IQ Booster Agent - Tutorial
+
+Welcome! This agent helps you discover, deploy, and configure Azure OpenAI models to "boost your AI's IQ".
+
+## What This Agent Does
+
+The IQ Booster connects to your Azure subscription to:
+1. **Discover** Azure OpenAI resources and available models
+2. **Deploy** new models (GPT-5-chat, GPT-4o, etc.)
+3. **Configure** both local AND Azure Function App settings automatically
+
+## Quick Start Commands
+
+### 1. Check Current Status
+```
+action: "status"
+```
+
+### 2. Find Azure OpenAI Resources
+```
+action: "discover_resources"
+```
+
+### 3. See Available Models in a Resource
+```
+action: "discover_models"
+resource_name: "your-openai-resource"
+```
+
+### 4. List Current Deployments
+```
+action: "list_deployments"
+resource_name: "your-openai-resource"
+```
+
+### 5. Deploy a New Model
+```
+action: "deploy"
+resource_name: "your-openai-resource"
+model_name: "gpt-5-chat"
+```
+
+### 6. Configure Local Settings
+```
+action: "configure_local"
+endpoint: "https://your-resource.openai.azure.com/"
+deployment_name: "gpt-5-chat"
+api_key: "your-key"
+```
+
+### 7. Configure Azure Function App (Production!)
+```
+action: "configure_azure"
+endpoint: "https://your-resource.openai.azure.com/"
+deployment_name: "gpt-5-chat"
+api_key: "your-key"
+function_app_name: "copilot365-xxx"
+```
+
+### 8. 🚀 ONE-CLICK FULL BOOST
+```
+action: "boost"
+```
+This automatically:
+- Finds all your Azure OpenAI resources
+- Identifies the best available model (gpt-5-chat > gpt-4o > gpt-4)
+- Deploys it if needed
+- Updates BOTH local.settings.json AND Azure Function App!
+
+## Dry Run Mode
+
+Add `dry_run: true` to see what would happen without making changes.
+
+## Prerequisites
+
+- Azure CLI logged in (`az login`)
+- Proper Azure permissions (Contributor on OpenAI resources)
+
+## Current Configuration
+
+"""
+
+_STATUS_HEADER = """# 📊 IQ Booster - Current Status
+
+## Active Configuration
+
+| Setting | Value |
+|---------|-------|
+"""
+
+_STATUS_CLI_HEADER = """
+
+## Azure CLI Status
+
+"""
+
+_STATUS_FOOTER = """
+
+## Next Steps
+
+- Use `action: "discover_resources"` to find Azure OpenAI resources
+- Use `action: "boost"` for automatic upgrade to best available model
+"""
+
+
+# Auto boost reply when the configured deployment already runs the top model
+_ALREADY_BEST_TMPL = """✅ Already using the best available model: `{model}` (deployment `{deployment}` in **{resource}**)
+
+No changes needed.
+"""
+
+# Closing report of a successful auto boost
+_SUMMARY_TMPL = """## 🎉 Boost Complete!
+
+### Configuration Applied:
+
+| Setting | Value |
+|---------|-------|
+| **Model** | {best_model} |
+| **Deployment** | {best_deployment} |
+| **Endpoint** | {endpoint} |
+| **API Key** | {api_key_preview} |
+
+### Updated:
+- ✅ local.settings.json
+- ✅ Azure Function App ({function_app_name})
+
+**Your AI has been upgraded to {best_model}!** 🧠✨
+
+For local testing: `func start`
+Production is already live!
+"""
+
 
 class IQBoosterAgent(BasicAgent):
     """
@@ -98,30 +479,37 @@ This agent can automatically upgrade your AI by finding gpt-5-chat or the best a
         }
         super().__init__(name=self.name, metadata=self.metadata)
 
-        # Load current configuration from environment
-        self.current_endpoint = os.environ.get('AZURE_OPENAI_ENDPOINT', '')
-        self.current_deployment = os.environ.get('AZURE_OPENAI_DEPLOYMENT_NAME', '')
-        self.current_api_key = os.environ.get('AZURE_OPENAI_API_KEY', '')
-        self.storage_account = os.environ.get('AZURE_STORAGE_ACCOUNT_NAME', 'st4ovzneuimhd2g')
-
         # Default resource group
         self.default_resource_group = 'rappai'
 
-        # Extract current resource name from endpoint
-        self.current_resource_name = self._extract_resource_name(self.current_endpoint)
+    # Current configuration is read from the environment on first use, so
+    # actions that never look at it don't pay for it
+
+    @functools.cached_property
+    def current_endpoint(self):
+        return os.environ.get('AZURE_OPENAI_ENDPOINT', '')
+
+    @functools.cached_property
+    def current_deployment(self):
+        return os.environ.get('AZURE_OPENAI_DEPLOYMENT_NAME', '')
+
+    @functools.cached_property
+    def current_api_key(self):
+        return os.environ.get('AZURE_OPENAI_API_KEY', '')
+
+    @functools.cached_property
+    def storage_account(self):
+        return os.environ.get('AZURE_STORAGE_ACCOUNT_NAME', 'st4ovzneuimhd2g')
+
+    @functools.cached_property
+    def current_resource_name(self):
+        return self._extract_resource_name(self.current_endpoint)
 
     def _extract_resource_name(self, endpoint):
         """Extract Azure OpenAI resource name from endpoint URL"""
-        if not endpoint:
-            return ''
-        try:
-            # https://resource-name.openai.azure.com/ -> resource-name
-            match = re.search(r'https://([^.]+)\.openai\.azure\.com', endpoint)
-            if match:
-                return match.group(1)
-            return endpoint.replace('https://', '').replace('http://', '').split('.')[0]
-        except:
-            return ''
+        # https://resource-name.openai.azure.com/ -> resource-name
+        host = endpoint.removeprefix('https://').removeprefix('http://')
+        return host.partition('.')[0]
 
     def perform(self, **kwargs):
         action = kwargs.get('action', 'tutorial')
@@ -154,111 +542,19 @@ This agent can automatically upgrade your AI by finding gpt-5-chat or the best a
 
     def _show_tutorial(self):
         """Interactive tutorial for newcomers"""
-        return """# 🧠 IQ Booster Agent - Tutorial
-
-Welcome! This agent helps you discover, deploy, and configure Azure OpenAI models to "boost your AI's IQ".
-
-## What This Agent Does
-
-The IQ Booster connects to your Azure subscription to:
-1. **Discover** Azure OpenAI resources and available models
-2. **Deploy** new models (GPT-5-chat, GPT-4o, etc.)
-3. **Configure** both local AND Azure Function App settings automatically
-
-## Quick Start Commands
-
-### 1. Check Current Status
-```
-action: "status"
-```
-
-### 2. Find Azure OpenAI Resources
-```
-action: "discover_resources"
-```
-
-### 3. See Available Models in a Resource
-```
-action: "discover_models"
-resource_name: "your-openai-resource"
-```
-
-### 4. List Current Deployments
-```
-action: "list_deployments"
-resource_name: "your-openai-resource"
-```
-
-### 5. Deploy a New Model
-```
-action: "deploy"
-resource_name: "your-openai-resource"
-model_name: "gpt-5-chat"
-```
-
-### 6. Configure Local Settings
-```
-action: "configure_local"
-endpoint: "https://your-resource.openai.azure.com/"
-deployment_name: "gpt-5-chat"
-api_key: "your-key"
-```
-
-### 7. Configure Azure Function App (Production!)
-```
-action: "configure_azure"
-endpoint: "https://your-resource.openai.azure.com/"
-deployment_name: "gpt-5-chat"
-api_key: "your-key"
-function_app_name: "copilot365-xxx"
-```
-
-### 8. 🚀 ONE-CLICK FULL BOOST
-```
-action: "boost"
-```
-This automatically:
-- Finds all your Azure OpenAI resources
-- Identifies the best available model (gpt-5-chat > gpt-4o > gpt-4)
-- Deploys it if needed
-- Updates BOTH local.settings.json AND Azure Function App!
-
-## Dry Run Mode
-
-Add `dry_run: true` to see what would happen without making changes.
-
-## Prerequisites
-
-- Azure CLI logged in (`az login`)
-- Proper Azure permissions (Contributor on OpenAI resources)
-
-## Current Configuration
-
-""" + self._get_status_summary()
+        return _TUTORIAL_PREFIX + self._get_status_summary()
 
     def _show_status(self):
         """Show current configuration status"""
-        return f"""# 📊 IQ Booster - Current Status
-
-## Active Configuration
-
-| Setting | Value |
-|---------|-------|
-| **Endpoint** | {self.current_endpoint or '(not set)'} |
-| **Resource** | {self.current_resource_name or '(not detected)'} |
-| **Deployment** | {self.current_deployment or '(not set)'} |
-| **API Key** | {'✅ Set (' + self.current_api_key[:8] + '...)' if self.current_api_key else '❌ Not set'} |
-| **Storage Account** | {self.storage_account or '(not set)'} |
-
-## Azure CLI Status
-
-""" + self._check_azure_cli_status() + """
-
-## Next Steps
-
-- Use `action: "discover_resources"` to find Azure OpenAI resources
-- Use `action: "boost"` for automatic upgrade to best available model
-"""
+        api_key = f"✅ Set ({self.current_api_key[:8]}...)" if self.current_api_key else '❌ Not set'
+        rows = [
+            f"| **Endpoint** | {self.current_endpoint or '(not set)'} |",
+            f"| **Resource** | {self.current_resource_name or '(not detected)'} |",
+            f"| **Deployment** | {self.current_deployment or '(not set)'} |",
+            f"| **API Key** | {api_key} |",
+            f"| **Storage Account** | {self.storage_account or '(not set)'} |",
+        ]
+        return _STATUS_HEADER + "\n".join(rows) + _STATUS_CLI_HEADER + self._check_azure_cli_status() + _STATUS_FOOTER
 
     def _get_status_summary(self):
         """Get a brief status summary"""
@@ -270,34 +566,200 @@ Add `dry_run: true` to see what would happen without making changes.
     def _check_azure_cli_status(self):
         """Check Azure CLI login status"""
         try:
-            result = subprocess.run(
-                ['az', 'account', 'show', '--query', '{name:name, user:user.name}', '-o', 'json'],
-                capture_output=True, text=True, timeout=10
-            )
-            if result.returncode == 0:
-                account = json.loads(result.stdout)
+            account = _get_az_account()
+            if account:
                 return f"✅ Logged in as: **{account.get('user', 'Unknown')}**\n📁 Subscription: **{account.get('name', 'Unknown')}**"
             else:
                 return "❌ Not logged in. Run `az login` first."
         except Exception as e:
             return f"⚠️ Could not check Azure CLI status: {str(e)}"
 
+    def _run_az(self, args, timeout=30):
+        """Run an az CLI command and return its parsed JSON output, raising RuntimeError on failure"""
+        result = subprocess.run(
+            [_AZ_BIN, *args, '--output', 'json'], capture_output=True, timeout=timeout, **_SUBPROCESS_KWARGS
+        )
+        if result.returncode != 0:
+            raise RuntimeError(_decode(result.stderr[:_STDERR_LIMIT]))
+        return _json_loads(result.stdout) if result.stdout.strip() else None
+
+    def _run_az_tsv(self, args, timeout=30):
+        """Run an az CLI command with TSV output and return its rows as lists of fields"""
+        result = subprocess.run(
+            [_AZ_BIN, *args, '--output', 'tsv'], capture_output=True, timeout=timeout, **_SUBPROCESS_KWARGS
+        )
+        if result.returncode != 0:
+            raise RuntimeError(_decode(result.stderr[:_STDERR_LIMIT]))
+        return [line.split('\t') for line in _decode(result.stdout).splitlines() if line]
+
+    def _run_az_quiet(self, args, timeout=30):
+        """Run an az CLI command whose output is not needed, raising RuntimeError on failure"""
+        # stdout is discarded and stderr goes to a file, so only the start
+        # of an error message is ever held in memory
+        with tempfile.TemporaryFile() as stderr:
+            result = subprocess.run(
+                [_AZ_BIN, *args, '--output', 'none'],
+                stdout=subprocess.DEVNULL, stderr=stderr, timeout=timeout, **_SUBPROCESS_KWARGS
+            )
+            if result.returncode != 0:
+                stderr.seek(0)
+                raise RuntimeError(_decode(stderr.read(_STDERR_LIMIT)))
+
+    def _run_az_list(self, args, timeout=30):
+        """
+        Run an az CLI command that prints a JSON array and return its items.
+
+        With ijson installed the array is parsed item by item straight from
+        the pipe, so the raw multi-MB output of a large subscription is never
+        held in memory alongside the parsed result.
+        """
+        if ijson is None:
+            return self._run_az(args, timeout) or []
+
+        with tempfile.TemporaryFile() as stderr, subprocess.Popen(
+            [_AZ_BIN, *args, '--output', 'json'], stdout=subprocess.PIPE, stderr=stderr, **_SUBPROCESS_KWARGS
+        ) as proc:
+            expired = threading.Event()
+
+            def kill():
+                expired.set()
+                proc.kill()
+
+            timer = threading.Timer(timeout, kill)
+            timer.start()
+            parse_error = None
+            try:
+                # No output at all means no items, as with _run_az
+                items = list(ijson.items(proc.stdout, 'item', use_float=True)) if proc.stdout.peek(1) else []
+            except ijson.JSONError as e:
+                items, parse_error = [], e
+            finally:
+                proc.stdout.close()
+                proc.wait()
+                timer.cancel()
+
+            if proc.returncode != 0:
+                if expired.is_set():
+                    raise subprocess.TimeoutExpired(proc.args, timeout)
+                stderr.seek(0)
+                raise RuntimeError(_decode(stderr.read(_STDERR_LIMIT)))
+        if parse_error is not None:
+            # Truncated or garbled output must not read as "nothing found"
+            raise RuntimeError(f"Could not parse az output: {str(parse_error).splitlines()[0]}")
+        return items
+
+    @_cached(ttl=_ACCOUNTS_TTL)
+    def _list_openai_accounts(self):
+        """List Azure OpenAI accounts as dicts with name, location, resourceGroup and endpoint"""
+        client = get_cs_client()
+        if client is None:
+            rows = self._run_az_tsv(['cognitiveservices', 'account', 'list', '--query', _OPENAI_ACCOUNT_QUERY])
+            return [dict(zip(_OPENAI_ACCOUNT_FIELDS, row)) for row in rows]
+
+        return [
+            {
+                'name': account.name,
+                'location': account.location,
+                # /subscriptions/{id}/resourceGroups/{group}/providers/...
+                'resourceGroup': account.id.split('/')[4],
+                'endpoint': account.properties.endpoint
+            }
+            for account in client.accounts.list()
+            if account.kind == 'OpenAI'
+        ]
+
+    @_cached(ttl=_MODELS_TTL)
+    def _list_account_models(self, resource_group, resource_name):
+        """List the models available to an Azure OpenAI account"""
+        client = get_cs_client()
+        if client is None:
+            return self._run_az_list([
+                'cognitiveservices', 'account', 'list-models',
+                '--name', resource_name,
+                '--resource-group', resource_group
+            ])
+        return [model.as_dict() for model in client.accounts.list_models(resource_group, resource_name)]
+
+    @_cached(ttl=_DEPLOYMENTS_TTL)
+    def _list_account_deployments(self, resource_group, resource_name):
+        """List the model deployments of an Azure OpenAI account"""
+        client = get_cs_client()
+        if client is None:
+            return self._run_az_list([
+                'cognitiveservices', 'account', 'deployment', 'list',
+                '--name', resource_name,
+                '--resource-group', resource_group
+            ])
+        return [dep.as_dict() for dep in client.deployments.list(resource_group, resource_name)]
+
+    def _create_deployment(self, resource_group, resource_name, deployment_name, model_name):
+        """Create a Standard deployment of an OpenAI model and wait for it to finish"""
+        client = get_cs_client()
+        if client is None:
+            self._run_az([
+                'cognitiveservices', 'account', 'deployment', 'create',
+                '--name', resource_name,
+                '--resource-group', resource_group,
+                '--deployment-name', deployment_name,
+                '--model-name', model_name,
+                '--model-version', 'latest',
+                '--model-format', 'OpenAI',
+                '--sku-capacity', '10',
+                '--sku-name', 'Standard'
+            ], timeout=300)
+        else:
+            from azure.mgmt.cognitiveservices.models import Deployment, DeploymentModel, DeploymentProperties, Sku
+
+            # Leaving the version unset deploys the model's current default version
+            deployment = Deployment(
+                sku=Sku(name='Standard', capacity=10),
+                properties=DeploymentProperties(model=DeploymentModel(format='OpenAI', name=model_name))
+            )
+            client.deployments.begin_create_or_update(
+                resource_group, resource_name, deployment_name, deployment
+            ).result(timeout=300)
+
+        _invalidate_cache('_list_account_deployments', resource_group, resource_name)
+
+    def _get_account_key(self, resource_group, resource_name):
+        """Get the primary API key of an Azure OpenAI account, or None if none is returned"""
+        client = get_cs_client()
+        if client is None:
+            rows = self._run_az_tsv([
+                'cognitiveservices', 'account', 'keys', 'list',
+                '--name', resource_name,
+                '--resource-group', resource_group,
+                '--query', 'key1'
+            ])
+            return rows[0][0] if rows and rows[0] else None
+        return client.accounts.list_keys(resource_group, resource_name).key1
+
+    def _update_app_settings(self, resource_group, function_app_name, settings):
+        """Merge settings into a Function App's application settings"""
+        client = get_web_client()
+        if client is None:
+            with _app_settings_arg(settings) as settings_arg:
+                self._run_az_quiet([
+                    'functionapp', 'config', 'appsettings', 'set',
+                    '--name', function_app_name,
+                    '--resource-group', resource_group,
+                    '--settings', settings_arg
+                ], timeout=60)
+            return
+
+        # The ARM update replaces the whole collection, so merge into the current one
+        app_settings = client.web_apps.list_application_settings(resource_group, function_app_name)
+        app_settings.properties = {**(app_settings.properties or {}), **settings}
+        client.web_apps.update_application_settings(resource_group, function_app_name, app_settings)
+
     def _discover_openai_resources(self, params):
         """Discover all Azure OpenAI resources in the subscription"""
         try:
             # List all Cognitive Services accounts of kind OpenAI
-            cmd = [
-                'az', 'cognitiveservices', 'account', 'list',
-                '--query', "[?kind=='OpenAI'].{name:name, location:location, resourceGroup:resourceGroup, endpoint:properties.endpoint}",
-                '--output', 'json'
-            ]
-
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-
-            if result.returncode != 0:
-                return f"Error discovering resources: {result.stderr}\n\nMake sure you're logged in: `az login`"
-
-            resources = json.loads(result.stdout) if result.stdout else []
+            try:
+                resources = self._list_openai_accounts()
+            except RuntimeError as e:
+                return f"Error discovering resources: {e}\n\nMake sure you're logged in: `az login`"
 
             if not resources:
                 return """# No Azure OpenAI Resources Found
@@ -317,15 +779,17 @@ No Azure OpenAI resources found in your subscription.
    ```
 """
 
-            response = f"""# 🔍 Azure OpenAI Resources Found: {len(resources)}
+            parts = [f"""# 🔍 Azure OpenAI Resources Found: {len(resources)}
 
 | Resource Name | Location | Resource Group | Endpoint |
 |--------------|----------|----------------|----------|
-"""
-            for r in resources:
-                response += f"| {r['name']} | {r['location']} | {r['resourceGroup']} | {r['endpoint']} |\n"
+"""]
+            parts.extend(
+                f"| {r['name']} | {r['location']} | {r['resourceGroup']} | {r['endpoint']} |\n"
+                for r in resources
+            )
 
-            response += f"""
+            parts.append(f"""
 
 ## Next Steps
 
@@ -342,8 +806,8 @@ action: "list_deployments"
 resource_name: "{resources[0]['name']}"
 resource_group: "{resources[0]['resourceGroup']}"
 ```
-"""
-            return response
+""")
+            return "".join(parts)
 
         except subprocess.TimeoutExpired:
             return "Error: Command timed out. Azure might be slow to respond."
@@ -381,29 +845,17 @@ az cognitiveservices account list-models \\
 """
 
         try:
-            cmd = [
-                'az', 'cognitiveservices', 'account', 'list-models',
-                '--name', resource_name,
-                '--resource-group', resource_group,
-                '--output', 'json'
-            ]
-
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-
-            if result.returncode != 0:
-                return f"Error: {result.stderr}"
-
-            models = json.loads(result.stdout) if result.stdout else []
+            models = self._list_account_models(resource_group, resource_name)
             gpt_models = [m for m in models if 'gpt' in m.get('name', '').lower()]
 
-            response = f"""# 🤖 Available Models in {resource_name}
+            parts = [f"""# 🤖 Available Models in {resource_name}
 
 **Total Models:** {len(models)}
 **GPT Models:** {len(gpt_models)}
 
 ## GPT Models (Chat/Completion)
 
-"""
+"""]
             # Sort to show newest first
             gpt_models.sort(key=lambda x: x.get('name', ''), reverse=True)
 
@@ -411,9 +863,9 @@ az cognitiveservices account list-models \\
                 name = model.get('name', 'Unknown')
                 is_gpt5 = 'gpt-5' in name.lower()
                 star = " ⭐ **RECOMMENDED**" if is_gpt5 else ""
-                response += f"{i}. `{name}`{star}\n"
+                parts.append(f"{i}. `{name}`{star}\n")
 
-            response += f"""
+            parts.append(f"""
 
 ## Deploy a Model
 
@@ -423,8 +875,8 @@ resource_name: "{resource_name}"
 resource_group: "{resource_group}"
 model_name: "gpt-5-chat"
 ```
-"""
-            return response
+""")
+            return "".join(parts)
 
         except Exception as e:
             return f"Error: {str(e)}"
@@ -441,30 +893,18 @@ model_name: "gpt-5-chat"
             return f"Dry run: Would list deployments in {resource_name}"
 
         try:
-            cmd = [
-                'az', 'cognitiveservices', 'account', 'deployment', 'list',
-                '--name', resource_name,
-                '--resource-group', resource_group,
-                '--output', 'json'
-            ]
+            deployments = self._list_account_deployments(resource_group, resource_name)
 
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-
-            if result.returncode != 0:
-                return f"Error: {result.stderr}"
-
-            deployments = json.loads(result.stdout) if result.stdout else []
-
-            response = f"""# 📦 Deployments in {resource_name}
+            parts = [f"""# 📦 Deployments in {resource_name}
 
 **Total Deployments:** {len(deployments)}
 
-"""
+"""]
             if not deployments:
-                response += "No deployments found. Create one with `action: \"deploy\"`"
+                parts.append("No deployments found. Create one with `action: \"deploy\"`")
             else:
-                response += "| Deployment Name | Model | Version | Capacity |\n"
-                response += "|-----------------|-------|---------|----------|\n"
+                parts.append("| Deployment Name | Model | Version | Capacity |\n")
+                parts.append("|-----------------|-------|---------|----------|\n")
 
                 for dep in deployments:
                     name = dep.get('name', 'Unknown')
@@ -475,9 +915,9 @@ model_name: "gpt-5-chat"
                     capacity = dep.get('sku', {}).get('capacity', 'N/A')
 
                     is_current = " ✅" if name == self.current_deployment else ""
-                    response += f"| {name}{is_current} | {model_name} | {model_version} | {capacity}K TPM |\n"
+                    parts.append(f"| {name}{is_current} | {model_name} | {model_version} | {capacity}K TPM |\n")
 
-            return response
+            return "".join(parts)
 
         except Exception as e:
             return f"Error: {str(e)}"
@@ -515,25 +955,12 @@ az cognitiveservices account deployment create \\
 """
 
         try:
-            cmd = [
-                'az', 'cognitiveservices', 'account', 'deployment', 'create',
-                '--name', resource_name,
-                '--resource-group', resource_group,
-                '--deployment-name', deployment_name,
-                '--model-name', model_name,
-                '--model-version', 'latest',
-                '--model-format', 'OpenAI',
-                '--sku-capacity', '10',
-                '--sku-name', 'Standard',
-                '--output', 'json'
-            ]
-
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-
-            if result.returncode != 0:
-                if 'already exists' in result.stderr.lower():
+            try:
+                self._create_deployment(resource_group, resource_name, deployment_name, model_name)
+            except Exception as e:
+                if 'already exists' in str(e).lower():
                     return f"✅ Deployment '{deployment_name}' already exists!"
-                return f"Error: {result.stderr}"
+                raise
 
             return f"""# ✅ Deployment Created Successfully!
 
@@ -584,28 +1011,25 @@ api_key: "<get-key-from-azure-portal>"
 """
 
         try:
-            # Read current settings
-            if os.path.exists(settings_path):
-                with open(settings_path, 'r') as f:
-                    settings = json.load(f)
-            else:
-                settings = {"IsEncrypted": False, "Values": {}}
+            updates = {
+                'AZURE_OPENAI_ENDPOINT': endpoint,
+                'AZURE_OPENAI_DEPLOYMENT_NAME': deployment_name
+            }
+            if api_key:
+                updates['AZURE_OPENAI_API_KEY'] = api_key
 
-            # Update settings
-            if 'Values' not in settings:
-                settings['Values'] = {}
+            previous, changed = _update_settings_file(settings_path, updates)
 
-            old_endpoint = settings['Values'].get('AZURE_OPENAI_ENDPOINT', '(not set)')
-            old_deployment = settings['Values'].get('AZURE_OPENAI_DEPLOYMENT_NAME', '(not set)')
+            if not changed:
+                return f"""# ✅ Local Settings Already Up To Date
 
-            settings['Values']['AZURE_OPENAI_ENDPOINT'] = endpoint
-            settings['Values']['AZURE_OPENAI_DEPLOYMENT_NAME'] = deployment_name
-            if api_key:
-                settings['Values']['AZURE_OPENAI_API_KEY'] = api_key
+**File:** {settings_path}
+
+Endpoint `{endpoint}` and deployment `{deployment_name}` are already configured. No changes needed.
+"""
 
-            # Write back
-            with open(settings_path, 'w') as f:
-                json.dump(settings, f, indent=2)
+            old_endpoint = previous.get('AZURE_OPENAI_ENDPOINT', '(not set)')
+            old_deployment = previous.get('AZURE_OPENAI_DEPLOYMENT_NAME', '(not set)')
 
             return f"""# ✅ Local Settings Updated!
 
@@ -654,25 +1078,15 @@ Remove `dry_run: true` to execute.
 """
 
         try:
-            # Build settings list
-            settings = [
-                f"AZURE_OPENAI_ENDPOINT={endpoint}",
-                f"AZURE_OPENAI_DEPLOYMENT_NAME={deployment_name}"
-            ]
+            # Build settings
+            settings = {
+                'AZURE_OPENAI_ENDPOINT': endpoint,
+                'AZURE_OPENAI_DEPLOYMENT_NAME': deployment_name
+            }
             if api_key:
-                settings.append(f"AZURE_OPENAI_API_KEY={api_key}")
+                settings['AZURE_OPENAI_API_KEY'] = api_key
 
-            cmd = [
-                'az', 'functionapp', 'config', 'appsettings', 'set',
-                '--name', function_app_name,
-                '--resource-group', resource_group,
-                '--settings'
-            ] + settings + ['--output', 'json']
-
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-
-            if result.returncode != 0:
-                return f"Error: {result.stderr}"
+            self._update_app_settings(resource_group, function_app_name, settings)
 
             return f"""# ✅ Azure Function App Updated!
 
@@ -695,6 +1109,32 @@ The Azure Function will use the new model on the next request.
         except Exception as e:
             return f"Error: {str(e)}"
 
+    def _current_model(self):
+        """
+        Look up the model behind the configured deployment.
+
+        Both lookups go through the ARM cache, so this is usually free.
+        Returns None when nothing is configured or the deployment can't be
+        found, so callers treat it as unknown rather than failing.
+        """
+        if not (self.current_resource_name and self.current_deployment):
+            return None
+        try:
+            resource = next(
+                (r for r in self._list_openai_accounts() if r['name'] == self.current_resource_name),
+                None
+            )
+            if resource is None:
+                return None
+            deployments = self._list_account_deployments(resource['resourceGroup'], resource['name'])
+        except Exception as e:
+            logging.debug(f"Could not check current deployment: {e}")
+            return None
+        for dep in deployments:
+            if dep.get('name') == self.current_deployment:
+                return dep.get('properties', {}).get('model', {}).get('name')
+        return None
+
     def _auto_boost(self, params, dry_run=False):
         """
         FULL AUTOMATIC IQ BOOST
@@ -725,161 +1165,153 @@ The Azure Function will use the new model on the next request.
 Remove `dry_run: true` to execute.
 """
 
-        response = """# 🚀 Auto Boost - Upgrading Your AI
+        parts = ["""# 🚀 Auto Boost - Upgrading Your AI
 
-"""
+"""]
+
+        current_model = self._current_model()
+        # Rank 0 is the head of _PRIORITY_MODELS; nothing can beat it
+        if current_model and _model_rank(current_model) == 0:
+            parts.append(_ALREADY_BEST_TMPL.format_map({
+                'model': current_model,
+                'deployment': self.current_deployment,
+                'resource': self.current_resource_name
+            }))
+            return "".join(parts)
 
         try:
             # Step 1: Discover resources
-            response += "## Step 1: Discovering Azure OpenAI Resources...\n\n"
-
-            cmd = [
-                'az', 'cognitiveservices', 'account', 'list',
-                '--query', "[?kind=='OpenAI'].{name:name, location:location, resourceGroup:resourceGroup, endpoint:properties.endpoint}",
-                '--output', 'json'
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-
-            if result.returncode != 0:
-                return response + f"❌ Error discovering resources: {result.stderr}"
+            parts.append("## Step 1: Discovering Azure OpenAI Resources...\n\n")
 
-            resources = json.loads(result.stdout) if result.stdout else []
+            try:
+                resources = self._list_openai_accounts()
+            except RuntimeError as e:
+                return "".join(parts) + f"❌ Error discovering resources: {e}"
 
             if not resources:
-                return response + "❌ No Azure OpenAI resources found in subscription."
+                return "".join(parts) + "❌ No Azure OpenAI resources found in subscription."
 
-            response += f"Found **{len(resources)}** OpenAI resource(s)\n\n"
+            parts.append(f"Found **{len(resources)}** OpenAI resource(s)\n\n")
 
             # Step 2: Find best model across all resources
-            response += "## Step 2: Finding Best Available Model...\n\n"
+            parts.append("## Step 2: Finding Best Available Model...\n\n")
 
             best_resource = None
             best_model = None
             best_deployment = None
-            priority_models = ['gpt-5-chat', 'gpt-5', 'gpt-4o', 'gpt-4-turbo', 'gpt-4', 'gpt-35-turbo']
-
-            for resource in resources:
-                r_name = resource['name']
-                r_group = resource['resourceGroup']
-
-                # Check existing deployments first
-                dep_cmd = [
-                    'az', 'cognitiveservices', 'account', 'deployment', 'list',
-                    '--name', r_name,
-                    '--resource-group', r_group,
-                    '--output', 'json'
-                ]
-                dep_result = subprocess.run(dep_cmd, capture_output=True, text=True, timeout=30)
-
-                if dep_result.returncode == 0:
-                    deployments = json.loads(dep_result.stdout) if dep_result.stdout else []
-
-                    for dep in deployments:
+            best_rank = len(_PRIORITY_MODELS)
+            best_index = len(resources)
+
+            def list_deployments(resource):
+                try:
+                    return self._list_account_deployments(resource['resourceGroup'], resource['name'])
+                except Exception as e:
+                    logging.warning(f"Could not list deployments in {resource['name']}: {e}")
+                    return []
+
+            # Check existing deployments first, querying every resource at once
+            # and scoring each listing as it arrives
+            executor = ThreadPoolExecutor(max_workers=min(len(resources), _MAX_PARALLEL_CALLS))
+            try:
+                deployment_futures = {executor.submit(list_deployments, r): i for i, r in enumerate(resources)}
+
+                for future in as_completed(deployment_futures):
+                    index = deployment_futures[future]
+                    resource = resources[index]
+
+                    for dep in future.result():
                         model_name = dep.get('properties', {}).get('model', {}).get('name', '')
                         dep_name = dep.get('name', '')
 
-                        for i, priority in enumerate(priority_models):
-                            if priority in model_name.lower():
-                                if best_model is None or i < priority_models.index(best_model):
-                                    best_resource = resource
-                                    best_model = model_name
-                                    best_deployment = dep_name
-                                    response += f"✅ Found `{model_name}` deployment `{dep_name}` in **{r_name}**\n"
-                                break
+                        # Ties go to the earlier resource, as in a sequential scan
+                        rank = _model_rank(model_name)
+                        if rank < len(_PRIORITY_MODELS) and (rank, index) < (best_rank, best_index):
+                            best_rank = rank
+                            best_index = index
+                            best_resource = resource
+                            best_model = model_name
+                            best_deployment = dep_name
+                            parts.append(f"✅ Found `{model_name}` deployment `{dep_name}` in **{resource['name']}**\n")
+
+                    if best_rank == 0:
+                        # Nothing outranks the top model, so stop waiting on slower resources
+                        break
+            finally:
+                for future in deployment_futures:
+                    future.cancel()
+                executor.shutdown(wait=False)
 
             if not best_model:
-                response += "No suitable model deployments found. Checking available models...\n"
+                parts.append("No suitable model deployments found. Checking available models...\n")
                 # TODO: Could add logic to deploy a new model here
-                return response + "\n❌ No deployable models found. Please deploy a model manually first."
+                return "".join(parts) + "\n❌ No deployable models found. Please deploy a model manually first."
 
-            response += f"\n**Best Model Found:** `{best_model}` (deployment: `{best_deployment}`)\n"
-            response += f"**Resource:** {best_resource['name']} ({best_resource['location']})\n\n"
+            parts.append(f"\n**Best Model Found:** `{best_model}` (deployment: `{best_deployment}`)\n")
+            parts.append(f"**Resource:** {best_resource['name']} ({best_resource['location']})\n\n")
 
             # Step 3: Get API key
-            response += "## Step 3: Retrieving API Key...\n\n"
-
-            key_cmd = [
-                'az', 'cognitiveservices', 'account', 'keys', 'list',
-                '--name', best_resource['name'],
-                '--resource-group', best_resource['resourceGroup'],
-                '--query', 'key1',
-                '--output', 'tsv'
-            ]
-            key_result = subprocess.run(key_cmd, capture_output=True, text=True, timeout=30)
-
-            if key_result.returncode != 0:
-                return response + f"❌ Error getting API key: {key_result.stderr}"
-
-            api_key = key_result.stdout.strip()
+            parts.append("## Step 3: Retrieving API Key...\n\n")
+
+            # Only the chosen resource's key is ever fetched
+            try:
+                api_key = self._get_account_key(best_resource['resourceGroup'], best_resource['name'])
+            except Exception as e:
+                return "".join(parts) + f"❌ Error getting API key: {e}"
+            if not api_key:
+                return "".join(parts) + f"❌ Error getting API key: no key returned for {best_resource['name']}"
             endpoint = best_resource['endpoint']
+            # Masked once here; the key itself is only passed on to the settings
+            api_key_preview = f"{api_key[:12]}...{api_key[-4:]}"
 
-            response += f"✅ API key retrieved\n"
-            response += f"✅ Endpoint: `{endpoint}`\n\n"
-
-            # Step 4: Update local.settings.json
-            response += "## Step 4: Updating Local Settings...\n\n"
-
-            settings_path = 'local.settings.json'
-            if os.path.exists(settings_path):
-                with open(settings_path, 'r') as f:
-                    settings = json.load(f)
-            else:
-                settings = {"IsEncrypted": False, "Values": {}}
-
-            if 'Values' not in settings:
-                settings['Values'] = {}
-
-            settings['Values']['AZURE_OPENAI_ENDPOINT'] = endpoint
-            settings['Values']['AZURE_OPENAI_DEPLOYMENT_NAME'] = best_deployment
-            settings['Values']['AZURE_OPENAI_API_KEY'] = api_key
-
-            with open(settings_path, 'w') as f:
-                json.dump(settings, f, indent=2)
+            parts.append(f"✅ API key retrieved\n")
+            parts.append(f"✅ Endpoint: `{endpoint}`\n\n")
 
-            response += "✅ local.settings.json updated\n\n"
-
-            # Step 5: Update Azure Function App
-            response += "## Step 5: Updating Azure Function App...\n\n"
-
-            az_cmd = [
-                'az', 'functionapp', 'config', 'appsettings', 'set',
-                '--name', function_app_name,
-                '--resource-group', resource_group,
-                '--settings',
-                f"AZURE_OPENAI_ENDPOINT={endpoint}",
-                f"AZURE_OPENAI_DEPLOYMENT_NAME={best_deployment}",
-                f"AZURE_OPENAI_API_KEY={api_key}",
-                '--output', 'none'
-            ]
-            az_result = subprocess.run(az_cmd, capture_output=True, text=True, timeout=60)
-
-            if az_result.returncode != 0:
-                response += f"⚠️ Warning updating Azure Function: {az_result.stderr}\n"
-            else:
-                response += f"✅ Azure Function App `{function_app_name}` updated\n\n"
+            new_settings = {
+                'AZURE_OPENAI_ENDPOINT': endpoint,
+                'AZURE_OPENAI_DEPLOYMENT_NAME': best_deployment,
+                'AZURE_OPENAI_API_KEY': api_key
+            }
+            # Steps 4 and 5 are independent, so the Function App's control-plane
+            # round-trip runs while the local settings are written; each
+            # outcome is reported on its own
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                app_update = executor.submit(
+                    self._update_app_settings, resource_group, function_app_name, new_settings
+                )
+                local_update = executor.submit(_update_settings_file, 'local.settings.json', new_settings)
+
+                # Step 4: Update local.settings.json
+                parts.append("## Step 4: Updating Local Settings...\n\n")
+
+                try:
+                    _, changed = local_update.result()
+                except Exception as e:
+                    parts.append(f"⚠️ Warning updating local.settings.json: {e}\n\n")
+                else:
+                    if changed:
+                        parts.append("✅ local.settings.json updated\n\n")
+                    else:
+                        parts.append("✅ local.settings.json already up to date\n\n")
+
+                # Step 5: Update Azure Function App
+                parts.append("## Step 5: Updating Azure Function App...\n\n")
+
+                try:
+                    app_update.result()
+                except Exception as e:
+                    parts.append(f"⚠️ Warning updating Azure Function: {e}\n")
+                else:
+                    parts.append(f"✅ Azure Function App `{function_app_name}` updated\n\n")
 
             # Summary
-            response += f"""## 🎉 Boost Complete!
-
-### Configuration Applied:
-
-| Setting | Value |
-|---------|-------|
-| **Model** | {best_model} |
-| **Deployment** | {best_deployment} |
-| **Endpoint** | {endpoint} |
-| **API Key** | {api_key[:12]}...{api_key[-4:]} |
-
-### Updated:
-- ✅ local.settings.json
-- ✅ Azure Function App ({function_app_name})
-
-**Your AI has been upgraded to {best_model}!** 🧠✨
-
-For local testing: `func start`
-Production is already live!
-"""
-            return response
+            parts.append(_SUMMARY_TMPL.format_map({
+                'best_model': best_model,
+                'best_deployment': best_deployment,
+                'endpoint': endpoint,
+                'api_key_preview': api_key_preview,
+                'function_app_name': function_app_name
+            }))
+            return "".join(parts)
 
         except Exception as e:
-            return response + f"\n❌ Error during boost: {str(e)}"
+            return "".join(parts) + f"\n❌ Error during boost: {str(e)}"
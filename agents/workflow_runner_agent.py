@@ -1,10 +1,174 @@
 from agents.basic_agent import BasicAgent
+from utils.azure_clients import get_secret_client, get_web_client
+import copy
+import hashlib
 import logging
 import json
+import operator
 import os
 import subprocess
 import re
-from typing import Any, Dict, Optional
+import shlex
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ${step_id.output_name} / ${variable_name} references in workflow strings
+_VAR_RE = re.compile(r'\$\{([^}]+)\}')
+
+# Validation conditions of the form "<left> <op> <right>"
+_COND_RE = re.compile(r'^\s*(.+?)\s*(==|!=|>=|<=|>|<)\s*(.+?)\s*$')
+_COND_OPS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>=': operator.ge,
+    '<=': operator.le,
+    '>': operator.gt,
+    '<': operator.lt
+}
+
+# Unquoted characters that mean a command needs the shell (pipes, redirects,
+# expansions, globs, comments) rather than a direct exec or SDK call
+_SHELL_CHARS = frozenset('|&;<>()$`*?[]{}~#\n')
+
+# Short az option names, normalized when matching commands to SDK calls
+_AZ_OPTION_ALIASES = {'-n': '--name', '-g': '--resource-group', '-o': '--output'}
+
+# Joins update_json_file values so they are resolved in a single pass
+_UPDATE_SEPARATOR = '\x1f'
+
+# Actions without side effects; such a step whose outputs nothing reads is skipped
+_PURE_ACTIONS = frozenset(('template', 'evaluate'))
+
+# Returned by _exec_az_sdk for commands that must run through the az CLI
+_NOT_ROUTED = object()
+
+
+def _json_loads(data):
+    """Parse JSON text or bytes, with orjson when it is installed"""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def _json_dumps(obj) -> bytes:
+    """Serialize to 2-space indented JSON bytes, with orjson when it is installed"""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2).encode()
+
+
+def _hash_json(obj: Any) -> str:
+    """Stable digest of a JSON-like value"""
+    payload = json.dumps(obj, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _compile_path(out_path: str):
+    """
+    Build the accessor for an az_command output path ('$', '$.length', '$.<key>').
+
+    Compiled once per distinct path, so extracting outputs is a function call
+    per output instead of re-parsing the path on every step run.
+    """
+    if out_path == '$':
+        return _identity
+    if out_path == '$.length':
+        return _list_length
+    if out_path.startswith('$.'):
+        # Simple JSON path (just first level)
+        key = out_path[2:]
+        return lambda data: data.get(key) if isinstance(data, dict) else data
+    return _identity
+
+
+def _identity(data: Any) -> Any:
+    return data
+
+
+def _list_length(data: Any) -> int:
+    return len(data) if isinstance(data, list) else 0
+
+
+def _step_refs(step: Dict) -> set:
+    """Every reference in a step: ${...} in its strings plus bare foreach/evaluate sources"""
+    refs = {ref for text in _iter_strings(step) if '${' in text for ref in _VAR_RE.findall(text)}
+    logic = step.get('logic')
+    for ref in (step.get('collection'), logic.get('source') if isinstance(logic, dict) else None):
+        if isinstance(ref, str) and ref and '${' not in ref:
+            refs.add(ref)
+    return refs
+
+
+def _is_dead_step(step_id: str, step: Dict, used: set) -> bool:
+    """Whether a step is pure, unreferenced and unable to stop the workflow"""
+    if step.get('action') not in _PURE_ACTIONS or step_id in used or step.get('validation'):
+        return False
+    # A failed evaluate aborts by default, which is itself an effect worth keeping
+    return step.get('action') == 'template' or not step.get('on_error', {}).get('abort', True)
+
+
+def _iter_strings(obj: Any):
+    """Yield every string key and leaf of a JSON-like value"""
+    if isinstance(obj, str):
+        yield obj
+    elif isinstance(obj, dict):
+        for key, value in obj.items():
+            if isinstance(key, str):
+                yield key
+            yield from _iter_strings(value)
+    elif isinstance(obj, list):
+        for item in obj:
+            yield from _iter_strings(item)
+
+
+def _needs_shell(command: str) -> bool:
+    """Whether a command uses shell syntax that shlex.split can't reproduce"""
+    quote = None
+    for ch in command:
+        if quote == "'":
+            if ch == "'":
+                quote = None
+        elif quote == '"':
+            if ch == '"':
+                quote = None
+            elif ch in '$`':
+                return True
+        elif ch in '\'"':
+            quote = ch
+        elif ch in _SHELL_CHARS:
+            return True
+    return quote is not None
+
+
+def _parse_az_options(args: List[str]) -> Optional[Dict[str, List[str]]]:
+    """Parse '--option value...' arguments into {'--option': [values]}, or None if they don't fit that shape"""
+    options: Dict[str, List[str]] = {}
+    current = None
+    for arg in args:
+        if arg.startswith('-'):
+            current = _AZ_OPTION_ALIASES.get(arg, arg)
+            if current in options:
+                return None
+            options[current] = []
+        elif current is None:
+            return None
+        else:
+            options[current].append(arg)
+    return options
+
+
+def _single(options: Dict[str, List[str]], name: str) -> Optional[str]:
+    """The value of an option given exactly once with one value, else None"""
+    values = options.get(name)
+    return values[0] if values and len(values) == 1 else None
+
 
 class WorkflowRunnerAgent(BasicAgent):
     """
@@ -83,10 +247,39 @@ This agent can run automation playbooks defined as JSON, with full variable subs
         # Workflow directory
         self.workflows_dir = "workflows"
 
+        # (name, description, step count) per workflow file, keyed by path and
+        # reused while the file's mtime and size are unchanged
+        self._list_cache: Dict[str, Tuple[float, int, Tuple[str, str, int]]] = {}
+
+        # Parsed workflow files keyed by absolute path, reused across
+        # describe/validate/dry_run/run while the file's mtime is unchanged
+        self._wf_cache: Dict[str, Tuple[int, Dict]] = {}
+
+        # Step outputs of the last run of each workflow file, so start_from_step
+        # can resolve references to skipped steps and "cache": true steps can
+        # be skipped when their resolved inputs are unchanged
+        self.step_cache_dir = os.path.join(os.path.expanduser('~'), '.entracopilot', 'workflow_cache')
+
         # Runtime context for variable storage
         self.context: Dict[str, Any] = {}
         self.step_outputs: Dict[str, Dict[str, Any]] = {}
 
+        # Parsed dotted references, and resolved values tagged with the
+        # state version they were read at; bump _state_version whenever
+        # context or step_outputs change
+        self._ref_parts_cache: Dict[str, Tuple[str, ...]] = {}
+        self._resolved_cache: Dict[str, Tuple[int, Any]] = {}
+        self._state_version = 0
+
+        # Step action handlers
+        self._dispatch = {
+            'az_command': self._exec_az_command,
+            'update_json_file': self._exec_update_json_file,
+            'template': self._exec_template,
+            'evaluate': self._exec_evaluate,
+            'foreach': self._exec_foreach
+        }
+
     def perform(self, **kwargs):
         action = kwargs.get('action', 'list')
 
@@ -114,32 +307,39 @@ This agent can run automation playbooks defined as JSON, with full variable subs
                 os.makedirs(self.workflows_dir)
                 return f"No workflows found. Created {self.workflows_dir}/ directory."
 
-            workflows = [f for f in os.listdir(self.workflows_dir) if f.endswith('.json')]
+            with os.scandir(self.workflows_dir) as it:
+                workflows = [e for e in it if e.name.endswith('.json') and e.is_file()]
 
             if not workflows:
                 return f"No workflows found in {self.workflows_dir}/"
 
-            response = f"# 📋 Available Workflows\n\n"
+            parts = [f"# 📋 Available Workflows\n\n"]
 
-            for wf_file in workflows:
-                wf_path = os.path.join(self.workflows_dir, wf_file)
+            for entry in workflows:
+                wf_file, wf_path = entry.name, entry.path
                 try:
-                    with open(wf_path, 'r') as f:
-                        wf = json.load(f)
-                    name = wf.get('name', wf_file)
-                    desc = wf.get('description', 'No description')[:80]
-                    steps = len(wf.get('steps', []))
-                    response += f"### {wf_file.replace('.json', '')}\n"
-                    response += f"- **Name:** {name}\n"
-                    response += f"- **Description:** {desc}\n"
-                    response += f"- **Steps:** {steps}\n\n"
+                    st = entry.stat()
+                    cached = self._list_cache.get(wf_path)
+                    if cached is not None and cached[:2] == (st.st_mtime, st.st_size):
+                        name, desc, steps = cached[2]
+                    else:
+                        with open(wf_path, 'rb') as f:
+                            wf = _json_loads(f.read())
+                        name = wf.get('name', wf_file)
+                        desc = wf.get('description', 'No description')[:80]
+                        steps = len(wf.get('steps', []))
+                        self._list_cache[wf_path] = (st.st_mtime, st.st_size, (name, desc, steps))
+                    parts.append(f"### {wf_file.replace('.json', '')}\n")
+                    parts.append(f"- **Name:** {name}\n")
+                    parts.append(f"- **Description:** {desc}\n")
+                    parts.append(f"- **Steps:** {steps}\n\n")
                 except:
-                    response += f"### {wf_file} (error reading)\n\n"
+                    parts.append(f"### {wf_file} (error reading)\n\n")
 
-            response += "\n**Run a workflow:**\n"
-            response += "```\naction: \"run\"\nworkflow_name: \"iq_boost_workflow\"\n```"
+            parts.append("\n**Run a workflow:**\n")
+            parts.append("```\naction: \"run\"\nworkflow_name: \"iq_boost_workflow\"\n```")
 
-            return response
+            return "".join(parts)
 
         except Exception as e:
             return f"Error listing workflows: {str(e)}"
@@ -161,11 +361,20 @@ This agent can run automation playbooks defined as JSON, with full variable subs
 
         wf_path = os.path.join(self.workflows_dir, workflow_name)
 
-        if not os.path.exists(wf_path):
-            raise FileNotFoundError(f"Workflow not found: {wf_path}")
+        try:
+            mtime_ns = os.stat(wf_path).st_mtime_ns
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Workflow not found: {wf_path}") from None
+
+        cache_key = os.path.abspath(wf_path)
+        cached = self._wf_cache.get(cache_key)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
 
-        with open(wf_path, 'r') as f:
-            return json.load(f)
+        with open(wf_path, 'rb') as f:
+            workflow = _json_loads(f.read())
+        self._wf_cache[cache_key] = (mtime_ns, workflow)
+        return workflow
 
     def _describe_workflow(self, params: Dict) -> str:
         """Show detailed information about a workflow"""
@@ -174,17 +383,17 @@ This agent can run automation playbooks defined as JSON, with full variable subs
             if not workflow:
                 return "Error: workflow_name or workflow_json required"
 
-            response = f"# 📖 Workflow: {workflow.get('name', 'Unnamed')}\n\n"
-            response += f"**Description:** {workflow.get('description', 'No description')}\n"
-            response += f"**Version:** {workflow.get('version', 'N/A')}\n"
-            response += f"**Author:** {workflow.get('author', 'Unknown')}\n\n"
+            parts = [f"# 📖 Workflow: {workflow.get('name', 'Unnamed')}\n\n"]
+            parts.append(f"**Description:** {workflow.get('description', 'No description')}\n")
+            parts.append(f"**Version:** {workflow.get('version', 'N/A')}\n")
+            parts.append(f"**Author:** {workflow.get('author', 'Unknown')}\n\n")
 
             # Variables
             variables = workflow.get('variables', {})
             if variables:
-                response += "## Variables\n\n"
-                response += "| Name | Type | Default | Description |\n"
-                response += "|------|------|---------|-------------|\n"
+                parts.append("## Variables\n\n")
+                parts.append("| Name | Type | Default | Description |\n")
+                parts.append("|------|------|---------|-------------|\n")
                 for var_name, var_def in variables.items():
                     if isinstance(var_def, dict):
                         vtype = var_def.get('type', 'any')
@@ -194,31 +403,31 @@ This agent can run automation playbooks defined as JSON, with full variable subs
                         vtype = type(var_def).__name__
                         vdefault = str(var_def)[:30]
                         vdesc = ''
-                    response += f"| {var_name} | {vtype} | {vdefault} | {vdesc} |\n"
-                response += "\n"
+                    parts.append(f"| {var_name} | {vtype} | {vdefault} | {vdesc} |\n")
+                parts.append("\n")
 
             # Steps
             steps = workflow.get('steps', [])
-            response += f"## Steps ({len(steps)})\n\n"
+            parts.append(f"## Steps ({len(steps)})\n\n")
             for i, step in enumerate(steps, 1):
                 step_id = step.get('id', f'step_{i}')
                 step_name = step.get('name', step_id)
                 step_action = step.get('action', 'unknown')
                 step_desc = step.get('description', '')[:60]
 
-                response += f"### {i}. {step_name}\n"
-                response += f"- **ID:** `{step_id}`\n"
-                response += f"- **Action:** `{step_action}`\n"
-                response += f"- **Description:** {step_desc}\n"
+                parts.append(f"### {i}. {step_name}\n")
+                parts.append(f"- **ID:** `{step_id}`\n")
+                parts.append(f"- **Action:** `{step_action}`\n")
+                parts.append(f"- **Description:** {step_desc}\n")
 
                 # Show outputs
                 outputs = step.get('outputs', {})
                 if outputs:
-                    response += f"- **Outputs:** {', '.join(outputs.keys())}\n"
+                    parts.append(f"- **Outputs:** {', '.join(outputs.keys())}\n")
 
-                response += "\n"
+                parts.append("\n")
 
-            return response
+            return "".join(parts)
 
         except Exception as e:
             return f"Error describing workflow: {str(e)}"
@@ -254,42 +463,41 @@ This agent can run automation playbooks defined as JSON, with full variable subs
                     errors.append(f"Step '{step_id}' missing 'action' field")
 
                 # Validate variable references
-                step_str = json.dumps(step)
-                refs = re.findall(r'\$\{([^}]+)\}', step_str)
+                refs = _step_refs(step)
                 for ref in refs:
-                    parts = ref.split('.')
-                    if len(parts) > 1:
-                        ref_step = parts[0]
+                    ref_parts = ref.split('.')
+                    if len(ref_parts) > 1:
+                        ref_step = ref_parts[0]
                         if ref_step not in step_ids and ref_step not in workflow.get('variables', {}):
                             # It's a forward reference or variable
                             pass  # Forward refs are OK
 
             # Generate report
-            response = f"# ✅ Workflow Validation: {workflow.get('name', 'Unnamed')}\n\n"
+            parts = [f"# ✅ Workflow Validation: {workflow.get('name', 'Unnamed')}\n\n"]
 
             if errors:
-                response += "## ❌ Errors\n"
+                parts.append("## ❌ Errors\n")
                 for err in errors:
-                    response += f"- {err}\n"
-                response += "\n"
+                    parts.append(f"- {err}\n")
+                parts.append("\n")
 
             if warnings:
-                response += "## ⚠️ Warnings\n"
+                parts.append("## ⚠️ Warnings\n")
                 for warn in warnings:
-                    response += f"- {warn}\n"
-                response += "\n"
+                    parts.append(f"- {warn}\n")
+                parts.append("\n")
 
             if not errors and not warnings:
-                response += "✅ Workflow is valid!\n\n"
+                parts.append("✅ Workflow is valid!\n\n")
             elif not errors:
-                response += "✅ Workflow is valid (with warnings)\n\n"
+                parts.append("✅ Workflow is valid (with warnings)\n\n")
             else:
-                response += "❌ Workflow has errors\n\n"
+                parts.append("❌ Workflow has errors\n\n")
 
-            response += f"**Steps:** {len(workflow.get('steps', []))}\n"
-            response += f"**Variables:** {len(workflow.get('variables', {}))}\n"
+            parts.append(f"**Steps:** {len(workflow.get('steps', []))}\n")
+            parts.append(f"**Variables:** {len(workflow.get('variables', {}))}\n")
 
-            return response
+            return "".join(parts)
 
         except Exception as e:
             return f"Error validating workflow: {str(e)}"
@@ -303,8 +511,8 @@ This agent can run automation playbooks defined as JSON, with full variable subs
 
             runtime_vars = params.get('variables', {})
 
-            response = f"# 🔍 Dry Run: {workflow.get('name', 'Unnamed')}\n\n"
-            response += "**This shows what would happen without making changes.**\n\n"
+            parts = [f"# 🔍 Dry Run: {workflow.get('name', 'Unnamed')}\n\n"]
+            parts.append("**This shows what would happen without making changes.**\n\n")
 
             # Initialize context with workflow variables
             self.context = {}
@@ -315,54 +523,57 @@ This agent can run automation playbooks defined as JSON, with full variable subs
                     self.context[var_name] = var_def.get('default')
                 else:
                     self.context[var_name] = var_def
+            self._state_version += 1
 
-            response += "## Variables\n"
+            parts.append("## Variables\n")
             for k, v in self.context.items():
                 display_v = str(v)[:50] + '...' if len(str(v)) > 50 else str(v)
-                response += f"- `{k}`: {display_v}\n"
-            response += "\n"
+                parts.append(f"- `{k}`: {display_v}\n")
+            parts.append("\n")
 
-            response += "## Execution Plan\n\n"
+            parts.append("## Execution Plan\n\n")
 
             for i, step in enumerate(workflow.get('steps', []), 1):
                 step_id = step.get('id', f'step_{i}')
                 step_name = step.get('name', step_id)
                 step_action = step.get('action', 'unknown')
 
-                response += f"### Step {i}: {step_name}\n"
-                response += f"- **Action:** `{step_action}`\n"
+                parts.append(f"### Step {i}: {step_name}\n")
+                parts.append(f"- **Action:** `{step_action}`\n")
 
                 if step_action == 'az_command':
                     cmd = step.get('command', '')
                     resolved_cmd = self._resolve_variables(cmd)
-                    response += f"- **Command:** `{resolved_cmd}`\n"
+                    parts.append(f"- **Command:** `{resolved_cmd}`\n")
 
                 elif step_action == 'update_json_file':
                     file_path = self._resolve_variables(step.get('file_path', ''))
-                    response += f"- **File:** `{file_path}`\n"
-                    response += f"- **Updates:** {list(step.get('updates', {}).keys())}\n"
+                    parts.append(f"- **File:** `{file_path}`\n")
+                    parts.append(f"- **Updates:** {list(step.get('updates', {}).keys())}\n")
 
                 elif step_action == 'template':
-                    response += f"- **Template:** (generates report)\n"
+                    parts.append(f"- **Template:** (generates report)\n")
 
                 outputs = step.get('outputs', {})
                 if outputs:
-                    response += f"- **Outputs:** {', '.join(outputs.keys())}\n"
+                    parts.append(f"- **Outputs:** {', '.join(outputs.keys())}\n")
                     # Simulate outputs for next steps
                     self.step_outputs[step_id] = {k: f"<{step_id}.{k}>" for k in outputs.keys()}
+                    self._state_version += 1
 
-                response += "\n"
+                parts.append("\n")
 
-            response += "---\n"
-            response += "**To execute:** Remove `dry_run` or use `action: \"run\"`\n"
+            parts.append("---\n")
+            parts.append("**To execute:** Remove `dry_run` or use `action: \"run\"`\n")
 
-            return response
+            return "".join(parts)
 
         except Exception as e:
             return f"Error in dry run: {str(e)}"
 
     def _run_workflow(self, params: Dict) -> str:
         """Execute a workflow"""
+        cache_path = None
         try:
             workflow = self._load_workflow(params)
             if not workflow:
@@ -376,6 +587,14 @@ This agent can run automation playbooks defined as JSON, with full variable subs
             self.context = {}
             self.step_outputs = {}
 
+            # Outputs persisted by the previous run of this workflow file
+            cache_path = self._step_cache_path(params)
+            workflow_hash = _hash_json(workflow)
+            step_cache = self._load_step_cache(cache_path, workflow_hash)
+            # Sensitive steps and every step that references one (their
+            # outputs may embed the secret) stay out of the cache
+            uncacheable = set()
+
             # Initialize variables
             for var_name, var_def in workflow.get('variables', {}).items():
                 if var_name in runtime_vars:
@@ -384,12 +603,21 @@ This agent can run automation playbooks defined as JSON, with full variable subs
                     self.context[var_name] = var_def.get('default')
                 else:
                     self.context[var_name] = var_def
+            self._state_version += 1
 
-            response = f"# 🚀 Running: {workflow.get('name', 'Unnamed')}\n\n"
+            parts = [f"# 🚀 Running: {workflow.get('name', 'Unnamed')}\n\n"]
 
             steps = workflow.get('steps', [])
             started = start_from is None
 
+            # Step ids / variables referenced anywhere, to find steps that
+            # cannot affect the result
+            used = set().union(*map(self._step_ref_heads, steps), self._step_ref_heads(workflow.get('on_complete', {})))
+            dead = set()
+
+            # Work out which steps run before executing any of them
+            plan = []
+            stopped_at = None
             for i, step in enumerate(steps, 1):
                 step_id = step.get('id', f'step_{i}')
                 step_name = step.get('name', step_id)
@@ -399,28 +627,72 @@ This agent can run automation playbooks defined as JSON, with full variable subs
                     if step_id == start_from:
                         started = True
                     else:
-                        response += f"⏭️ Skipping: {step_name}\n"
+                        # Keep the last run's outputs so later steps still resolve,
+                        # but only if they were computed from the same inputs
+                        cached = step_cache.get(step_id)
+                        if cached is None:
+                            parts.append(f"⏭️ Skipping: {step_name}\n")
+                            continue
+                        if cached.get('input_hash') != self._step_input_hash(step):
+                            return (f"Error: cannot resume from '{start_from}': step '{step_id}' last ran "
+                                    f"with different inputs. Run the workflow from the start.")
+                        self.step_outputs[step_id] = cached['outputs']
+                        self._state_version += 1
+                        parts.append(f"⏭️ Skipping: {step_name} (reusing last run's outputs)\n")
                         continue
 
                 # Handle stop_at
                 if stop_at and step_id == stop_at:
-                    response += f"\n⏹️ Stopping at: {step_name}\n"
+                    stopped_at = step_name
                     break
 
-                response += f"\n## Step {i}: {step_name}\n"
+                if _is_dead_step(step_id, step, used):
+                    dead.add(step_id)
+                plan.append((i, step_id, step))
 
+            def execute(runner, step_id, step):
+                """Run one step on a runner, returning (result or raised exception, input hash)"""
+                if step_id in dead:
+                    return {'success': True, 'outputs': {}, 'skipped': True}, None
+                input_hash = None
                 try:
-                    result = self._execute_step(step)
+                    if cache_path:
+                        # Recorded for every step so a resume can check the inputs
+                        # its reused outputs were computed from
+                        input_hash = runner._step_input_hash(step)
+                    # Opted-in steps are skipped when their inputs match the last run
+                    if step.get('cache') and cache_path:
+                        cached = step_cache.get(step_id)
+                        if cached and cached.get('input_hash') == input_hash:
+                            return {'success': True, 'outputs': cached['outputs'], 'cached': True}, input_hash
+                    return runner._execute_step(step), input_hash
+                except Exception as e:
+                    return e, input_hash
+
+            def report(i, step_id, step, result, input_hash):
+                """Append a finished step's report; False when the workflow must stop"""
+                parts.append(f"\n## Step {i}: {step.get('name', step_id)}\n")
+                if step_id in dead:
+                    parts.append("⏭️ Skipped (outputs unused)\n")
+                    return True
 
-                    # Store outputs
-                    outputs = step.get('outputs', {})
-                    self.step_outputs[step_id] = result.get('outputs', {})
+                try:
+                    if isinstance(result, Exception):
+                        raise result
 
                     # Check for sensitive data
                     is_sensitive = step.get('sensitive', False)
 
                     if result.get('success'):
-                        response += f"✅ Success\n"
+                        parts.append("✅ Success (cached)\n" if result.get('cached') else "✅ Success\n")
+
+                        # Secrets never reach the on-disk cache
+                        if cache_path:
+                            if is_sensitive or not uncacheable.isdisjoint(self._step_ref_heads(step)):
+                                uncacheable.add(step_id)
+                                step_cache.pop(step_id, None)
+                            else:
+                                step_cache[step_id] = {'input_hash': input_hash, 'outputs': self.step_outputs[step_id]}
 
                         # Show outputs (mask sensitive)
                         for out_name, out_value in self.step_outputs[step_id].items():
@@ -430,18 +702,18 @@ This agent can run automation playbooks defined as JSON, with full variable subs
                                 display_val = str(out_value)[:100]
                                 if len(str(out_value)) > 100:
                                     display_val += "..."
-                            response += f"   - `{out_name}`: {display_val}\n"
+                            parts.append(f"   - `{out_name}`: {display_val}\n")
                     else:
                         error_msg = result.get('error', 'Unknown error')
-                        response += f"❌ Error: {error_msg}\n"
+                        parts.append(f"❌ Error: {error_msg}\n")
 
                         # Check on_error handler
                         on_error = step.get('on_error', {})
                         if on_error.get('abort', True):
-                            response += f"\n**Workflow aborted:** {on_error.get('message', error_msg)}\n"
-                            return response
+                            parts.append(f"\n**Workflow aborted:** {on_error.get('message', error_msg)}\n")
+                            return False
                         else:
-                            response += f"   (continuing despite error)\n"
+                            parts.append(f"   (continuing despite error)\n")
 
                     # Validation
                     validation = step.get('validation', {})
@@ -452,101 +724,327 @@ This agent can run automation playbooks defined as JSON, with full variable subs
                         try:
                             if not self._eval_condition(resolved_condition):
                                 error_msg = validation.get('error_message', 'Validation failed')
-                                response += f"⚠️ Validation failed: {error_msg}\n"
+                                parts.append(f"⚠️ Validation failed: {error_msg}\n")
                                 if validation.get('abort', True):
-                                    return response
+                                    return False
                         except:
                             pass
 
                 except Exception as e:
-                    response += f"❌ Exception: {str(e)}\n"
+                    parts.append(f"❌ Exception: {str(e)}\n")
                     on_error = step.get('on_error', {})
                     if on_error.get('abort', True):
-                        return response
+                        return False
+
+                return True
+
+            if workflow.get('parallel') and len(plan) > 1:
+                completed = self._run_steps_concurrently(plan, execute, report, workflow.get('max_workers', 8))
+            else:
+                completed = True
+                for i, step_id, step in plan:
+                    result, input_hash = execute(self, step_id, step)
+                    self._store_step_outputs(step_id, result)
+                    if not report(i, step_id, step, result, input_hash):
+                        completed = False
+                        break
+
+            if not completed:
+                return "".join(parts)
+
+            if stopped_at is not None:
+                parts.append(f"\n⏹️ Stopping at: {stopped_at}\n")
 
             # On complete
             on_complete = workflow.get('on_complete', {})
             if on_complete.get('action') == 'return':
                 value_template = on_complete.get('value', '')
                 final_value = self._resolve_variables(value_template)
-                response += f"\n---\n\n{final_value}"
+                parts.append(f"\n---\n\n{final_value}")
 
-            return response
+            return "".join(parts)
 
         except Exception as e:
             logging.error(f"Workflow execution error: {str(e)}")
             return f"Error running workflow: {str(e)}"
 
+        finally:
+            if cache_path:
+                self._save_step_cache(cache_path, workflow_hash, step_cache)
+
+    def _store_step_outputs(self, step_id: str, result: Any) -> None:
+        """Record a finished step's outputs for later references (not for steps that raised)"""
+        if not isinstance(result, Exception):
+            self.step_outputs[step_id] = result.get('outputs', {})
+            self._state_version += 1
+
+    def _run_steps_concurrently(self, plan: List[Tuple[int, str, Dict]], execute, report, max_workers: int) -> bool:
+        """
+        Run planned steps on a thread pool in dependency order.
+
+        A step waits only for the earlier steps it references, so independent
+        branches (separate az reads, say) overlap and wall time follows the
+        critical path. Each step runs on a fork of the runner taken once its
+        dependencies have finished. Reports are still written in workflow
+        order. Dependents of a step with a validation block wait until it has
+        been reported, and a failure that aborts the workflow stops any later
+        step from starting; steps already running are allowed to finish.
+
+        Returns False if the workflow was stopped.
+        """
+        # Dependencies: the latest earlier planned step with each referenced id
+        positions: Dict[str, int] = {}
+        waiting: Dict[int, set] = {}
+        for pos, (_, step_id, step) in enumerate(plan):
+            waiting[pos] = {positions[head] for head in self._step_ref_heads(step) if head in positions}
+            positions[step_id] = pos
+
+        settled = set()
+        results: Dict[int, Tuple[Any, Optional[str]]] = {}
+        next_report = 0
+        halt_at = len(plan)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running = {}
+            while next_report < len(plan):
+                # Start every step whose dependencies have settled
+                for pos in [pos for pos, deps in waiting.items() if pos < halt_at and deps <= settled]:
+                    del waiting[pos]
+                    _, step_id, step = plan[pos]
+                    running[executor.submit(execute, self._fork(), step_id, step)] = pos
+
+                if running and next_report not in results:
+                    completed, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in completed:
+                        pos = running.pop(future)
+                        _, step_id, step = plan[pos]
+                        result = results[pos] = future.result()
+                        self._store_step_outputs(step_id, result[0])
+                        failed = isinstance(result[0], Exception) or not result[0].get('success')
+                        if failed and step.get('on_error', {}).get('abort', True):
+                            halt_at = min(halt_at, pos + 1)
+                        elif not step.get('validation'):
+                            settled.add(pos)
+
+                # Report finished steps in workflow order
+                while next_report in results:
+                    i, step_id, step = plan[next_report]
+                    result, input_hash = results.pop(next_report)
+                    if not report(i, step_id, step, result, input_hash):
+                        return False
+                    settled.add(next_report)
+                    next_report += 1
+        return True
+
+    def _step_cache_path(self, params: Dict) -> Optional[str]:
+        """Where a workflow file's step outputs persist between runs; None for inline workflows"""
+        workflow_name = params.get('workflow_name')
+        if params.get('workflow_json') or not workflow_name:
+            return None
+        return os.path.join(self.step_cache_dir, os.path.basename(workflow_name).removesuffix('.json') + '.json')
+
+    def _load_step_cache(self, cache_path: Optional[str], workflow_hash: str) -> Dict[str, Dict]:
+        """Load persisted step outputs, discarding them if the workflow definition changed"""
+        if not cache_path:
+            return {}
+        try:
+            with open(cache_path, 'rb') as f:
+                cache = _json_loads(f.read())
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(cache, dict) or cache.get('workflow_hash') != workflow_hash:
+            return {}
+        return cache.get('steps', {})
+
+    def _save_step_cache(self, cache_path: str, workflow_hash: str, step_cache: Dict[str, Dict]) -> None:
+        """Persist step outputs for the next run; failures only cost the cache"""
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            data = _json_dumps({'workflow_hash': workflow_hash, 'steps': step_cache})
+            tmp_path = cache_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, cache_path)
+        except (OSError, TypeError, ValueError) as e:
+            logging.debug(f"Could not save workflow step cache: {e}")
+
+    def _step_input_hash(self, step: Dict) -> str:
+        """Hash a step's definition together with the current values of everything it references"""
+        refs = sorted(_step_refs(step))
+        return _hash_json({'step': step, 'refs': {ref: self._resolve_variable_ref(ref) for ref in refs}})
+
+    def _step_ref_heads(self, step: Dict) -> set:
+        """The step ids / variable names a step's ${...} references start with"""
+        return {self._ref_parts(ref)[0] for ref in _step_refs(step)}
+
     def _execute_step(self, step: Dict) -> Dict:
         """Execute a single workflow step"""
         action = step.get('action', '')
 
-        if action == 'az_command':
-            return self._exec_az_command(step)
-        elif action == 'update_json_file':
-            return self._exec_update_json_file(step)
-        elif action == 'template':
-            return self._exec_template(step)
-        elif action == 'evaluate':
-            return self._exec_evaluate(step)
-        elif action == 'foreach':
-            return self._exec_foreach(step)
-        else:
+        handler = self._dispatch.get(action)
+        if handler is None:
             return {'success': False, 'error': f"Unknown action: {action}"}
+        return handler(step)
 
     def _exec_az_command(self, step: Dict) -> Dict:
         """Execute an Azure CLI command"""
         try:
             command = step.get('command', '')
             resolved_cmd = self._resolve_variables(command)
+            output_defs = step.get('outputs', {})
 
-            # Split command for subprocess
-            # Use shell=True for complex commands with pipes
-            result = subprocess.run(
-                resolved_cmd,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=60
-            )
-
-            if result.returncode != 0:
-                return {
-                    'success': False,
-                    'error': result.stderr or f"Command failed with code {result.returncode}",
-                    'outputs': {}
-                }
+            data = self._exec_az_sdk(resolved_cmd)
+            if data is not _NOT_ROUTED:
+                return {'success': True, 'outputs': self._extract_outputs(data, output_defs)}
+
+            # Plain commands are exec'd directly; only ones with pipes,
+            # redirects or expansions pay for a /bin/sh process. cmd.exe quoting
+            # differs from POSIX, so Windows always goes through the shell
+            use_shell = os.name == 'nt' or _needs_shell(resolved_cmd)
+            if not use_shell:
+                argv = shlex.split(resolved_cmd)
+                use_shell = not argv or '=' in argv[0]
+
+            # stdout is read straight off the pipe as bytes (the JSON parsers take
+            # them as-is) and stderr goes to a file, so neither pipe can stall
+            # the command and no text decoding happens on the success path
+            with tempfile.TemporaryFile() as stderr, subprocess.Popen(
+                resolved_cmd if use_shell else argv,
+                shell=use_shell,
+                stdout=subprocess.PIPE,
+                stderr=stderr
+            ) as proc:
+                expired = threading.Event()
+
+                def kill():
+                    expired.set()
+                    proc.kill()
+
+                timer = threading.Timer(60, kill)
+                timer.start()
+                try:
+                    stdout = proc.stdout.read()
+                finally:
+                    proc.stdout.close()
+                    proc.wait()
+                    timer.cancel()
+
+                if expired.is_set():
+                    raise subprocess.TimeoutExpired(resolved_cmd, 60)
+
+                if proc.returncode != 0:
+                    stderr.seek(0)
+                    error = stderr.read().decode(errors='replace')
+                    return {
+                        'success': False,
+                        'error': error or f"Command failed with code {proc.returncode}",
+                        'outputs': {}
+                    }
 
             # Parse outputs
-            outputs = {}
-            output_defs = step.get('outputs', {})
-
             try:
                 # Try to parse as JSON
-                data = json.loads(result.stdout) if result.stdout.strip() else {}
-            except json.JSONDecodeError:
+                data = _json_loads(stdout) if stdout.strip() else {}
+            except (json.JSONDecodeError, UnicodeDecodeError):
                 # Plain text output
-                data = result.stdout.strip()
-
-            for out_name, out_path in output_defs.items():
-                if out_path == '$':
-                    outputs[out_name] = data
-                elif out_path == '$.length':
-                    outputs[out_name] = len(data) if isinstance(data, list) else 0
-                elif out_path.startswith('$.'):
-                    # Simple JSON path (just first level)
-                    key = out_path[2:]
-                    outputs[out_name] = data.get(key) if isinstance(data, dict) else data
-                else:
-                    outputs[out_name] = data
+                data = stdout.decode(errors='replace').strip()
 
-            return {'success': True, 'outputs': outputs}
+            return {'success': True, 'outputs': self._extract_outputs(data, output_defs)}
 
         except subprocess.TimeoutExpired:
             return {'success': False, 'error': 'Command timed out', 'outputs': {}}
         except Exception as e:
             return {'success': False, 'error': str(e), 'outputs': {}}
 
+    def _extract_outputs(self, data: Any, output_defs: Dict) -> Dict:
+        """Pick a step's outputs out of parsed command output"""
+        return {out_name: _compile_path(out_path)(data) for out_name, out_path in output_defs.items()}
+
+    def _exec_az_sdk(self, command: str) -> Any:
+        """
+        Run a common az command through a shared Azure SDK client.
+
+        Saves the az interpreter start-up and token refresh paid by every CLI
+        call. Returns what the command would have printed, parsed, or
+        _NOT_ROUTED when the command isn't one of the mapped ones, its SDK
+        is not installed or the SDK call fails (auth, permissions, wrong
+        subscription...), in which case it runs through az as before.
+        """
+        if _needs_shell(command):
+            return _NOT_ROUTED
+        argv = shlex.split(command)
+        if len(argv) < 4 or argv[0] != 'az':
+            return _NOT_ROUTED
+
+        try:
+            if argv[1:5] == ['functionapp', 'config', 'appsettings', 'set']:
+                return self._sdk_set_app_settings(_parse_az_options(argv[5:]))
+            if argv[1:4] == ['keyvault', 'secret', 'show']:
+                return self._sdk_show_secret(_parse_az_options(argv[4:]))
+        except Exception as e:
+            # Both commands are safe to repeat, so let the CLI have a go
+            logging.info(f"SDK call failed, retrying with the az CLI: {e}")
+        return _NOT_ROUTED
+
+    def _sdk_set_app_settings(self, options: Optional[Dict[str, List[str]]]) -> Any:
+        """`az functionapp config appsettings set --name --resource-group --settings K=V...`"""
+        if options is None or not options.keys() <= {'--name', '--resource-group', '--settings', '--output'}:
+            return _NOT_ROUTED
+        name = _single(options, '--name')
+        resource_group = _single(options, '--resource-group')
+        settings = options.get('--settings')
+        output = _single(options, '--output') or 'json'
+        if not (name and resource_group and settings) or output not in ('json', 'none'):
+            return _NOT_ROUTED
+        if any('=' not in setting or setting.startswith('@') for setting in settings):
+            return _NOT_ROUTED
+
+        client = get_web_client()
+        if client is None:
+            return _NOT_ROUTED
+
+        # The ARM update replaces the whole collection, so merge into the current one
+        app_settings = client.web_apps.list_application_settings(resource_group, name)
+        app_settings.properties = {
+            **(app_settings.properties or {}),
+            **dict(setting.split('=', 1) for setting in settings)
+        }
+        updated = client.web_apps.update_application_settings(resource_group, name, app_settings)
+
+        if output == 'none':
+            return {}
+        return [
+            {'name': key, 'value': value, 'slotSetting': False}
+            for key, value in (updated.properties or {}).items()
+        ]
+
+    def _sdk_show_secret(self, options: Optional[Dict[str, List[str]]]) -> Any:
+        """`az keyvault secret show --vault-name --name [--query value]`"""
+        if options is None or not options.keys() <= {'--vault-name', '--name', '--query', '--output'}:
+            return _NOT_ROUTED
+        vault_name = _single(options, '--vault-name')
+        name = _single(options, '--name')
+        query = _single(options, '--query')
+        output = _single(options, '--output') or 'json'
+        if not (vault_name and name) or ('--query' in options and query != 'value'):
+            return _NOT_ROUTED
+        if output not in ('json', 'tsv') or (output == 'tsv' and not query):
+            return _NOT_ROUTED
+
+        client = get_secret_client(vault_name)
+        if client is None:
+            return _NOT_ROUTED
+
+        secret = client.get_secret(name)
+        if query:
+            return secret.value
+        return {
+            'id': secret.id,
+            'name': secret.name,
+            'value': secret.value,
+            'contentType': secret.properties.content_type,
+            'tags': secret.properties.tags
+        }
+
     def _exec_update_json_file(self, step: Dict) -> Dict:
         """Update a JSON file with new values"""
         try:
@@ -555,41 +1053,50 @@ This agent can run automation playbooks defined as JSON, with full variable subs
 
             # Read existing file
             if os.path.exists(file_path):
-                with open(file_path, 'r') as f:
-                    data = json.load(f)
+                with open(file_path, 'rb') as f:
+                    data = _json_loads(f.read())
             else:
                 data = {}
 
             # Store previous values for output
             previous = {}
 
+            # Resolve every value in one regex pass: join them with a unit
+            # separator, substitute once and split back
+            raw_values = [str(value) for value in updates.values()]
+            resolved_values = self._resolve_variables(_UPDATE_SEPARATOR.join(raw_values)).split(_UPDATE_SEPARATOR)
+            if len(resolved_values) != len(raw_values):
+                # A substituted value contained the separator itself
+                resolved_values = [self._resolve_variables(value) for value in raw_values]
+
             # Apply updates
-            for key_path, value in updates.items():
-                resolved_value = self._resolve_variables(str(value))
+            for key_path, resolved_value in zip(updates, resolved_values):
 
                 # Handle nested keys like "Values.AZURE_OPENAI_ENDPOINT"
                 keys = key_path.split('.')
                 current = data
 
-                # Store previous value
-                try:
-                    prev_current = data
-                    for k in keys[:-1]:
-                        prev_current = prev_current.get(k, {})
-                    previous[key_path] = prev_current.get(keys[-1])
-                except:
-                    previous[key_path] = None
-
-                # Set new value
+                # One descent both records the previous value and sets the new one
                 for k in keys[:-1]:
                     if k not in current:
                         current[k] = {}
                     current = current[k]
+                previous[key_path] = current.get(keys[-1]) if isinstance(current, dict) else None
                 current[keys[-1]] = resolved_value
 
-            # Write back
-            with open(file_path, 'w') as f:
-                json.dump(data, f, indent=2)
+            # Write back via a temp file and rename, so a crash mid-write
+            # leaves the previous file intact
+            tmp_path = file_path + '.tmp'
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(_json_dumps(data))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, file_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
 
             outputs = {'updated': True}
             outputs.update({f"previous_{k.replace('.', '_')}": v for k, v in previous.items()})
@@ -655,18 +1162,34 @@ This agent can run automation playbooks defined as JSON, with full variable subs
             if not isinstance(collection, list):
                 collection = [collection] if collection else []
 
-            all_results = []
-
-            for item in collection:
-                # Set the loop variable
-                var_name = step.get('as', 'item')
-                self.context[var_name] = item
+            var_name = step.get('as', 'item')
+            sub_steps = step.get('steps', [])
 
+            def run_iteration(runner):
                 # Execute sub-steps
-                for sub_step in step.get('steps', []):
-                    result = self._execute_step(sub_step)
+                results = []
+                for sub_step in sub_steps:
+                    result = runner._execute_step(sub_step)
                     if result.get('success'):
-                        all_results.append(result.get('outputs', {}))
+                        results.append(result.get('outputs', {}))
+                return results
+
+            if step.get('parallel') and len(collection) > 1:
+                # Iterations are independent (typically one az call each), so
+                # run them on a thread pool, each with its own copy of the context
+                runners = [self._fork(**{var_name: item}) for item in collection]
+                max_workers = min(step.get('max_workers', 8), len(collection))
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    per_item = list(executor.map(run_iteration, runners))
+            else:
+                per_item = []
+                for item in collection:
+                    # Set the loop variable
+                    self.context[var_name] = item
+                    self._state_version += 1
+                    per_item.append(run_iteration(self))
+
+            all_results = [outputs for results in per_item for outputs in results]
 
             outputs = {}
             for out_name, out_expr in step.get('outputs', {}).items():
@@ -680,50 +1203,82 @@ This agent can run automation playbooks defined as JSON, with full variable subs
         except Exception as e:
             return {'success': False, 'error': str(e), 'outputs': {}}
 
+    def _fork(self, **variables) -> 'WorkflowRunnerAgent':
+        """Copy of this runner with its own context and caches, for running steps on another thread"""
+        runner = copy.copy(self)
+        runner.context = {**self.context, **variables}
+        runner.step_outputs = dict(self.step_outputs)
+        runner._resolved_cache = {}
+        runner._dispatch = {action: getattr(runner, handler.__name__) for action, handler in self._dispatch.items()}
+        return runner
+
     def _resolve_variables(self, text: str) -> str:
         """Resolve ${variable} references in text"""
         if not text or not isinstance(text, str):
             return str(text) if text else ''
 
+        # Most strings are literals; skip the regex engine entirely for them
+        if '${' not in text:
+            return text
+
         def replace_var(match):
             var_ref = match.group(1)
             value = self._resolve_variable_ref(var_ref)
             return str(value) if value is not None else match.group(0)
 
-        return re.sub(r'\$\{([^}]+)\}', replace_var, text)
+        return _VAR_RE.sub(replace_var, text)
 
     def _resolve_variable_ref(self, ref: str) -> Any:
         """Resolve a variable reference like 'step_id.output_name' or 'variable_name'"""
-        parts = ref.split('.')
+        # Plain names are two dict lookups, cheaper than the cache itself
+        if '.' not in ref:
+            step_outputs = self.step_outputs
+            if ref in step_outputs:
+                return step_outputs[ref]
+            return self.context.get(ref)
+
+        cached = self._resolved_cache.get(ref)
+        if cached is not None and cached[0] == self._state_version:
+            return cached[1]
+
+        value = self._lookup_variable_ref(ref)
+        self._resolved_cache[ref] = (self._state_version, value)
+        return value
+
+    def _lookup_variable_ref(self, ref: str) -> Any:
+        """Walk step outputs, then context variables, for a dotted reference"""
+        parts = self._ref_parts(ref)
 
         # Check step outputs first
         if parts[0] in self.step_outputs:
             current = self.step_outputs[parts[0]]
-            for part in parts[1:]:
-                if isinstance(current, dict):
-                    current = current.get(part)
-                else:
-                    return None
-            return current
-
         # Check context variables
-        if parts[0] in self.context:
+        elif parts[0] in self.context:
             current = self.context[parts[0]]
-            for part in parts[1:]:
-                if isinstance(current, dict):
-                    current = current.get(part)
-                else:
-                    return None
-            return current
+        else:
+            return None
 
-        return None
+        get = dict.get
+        for part in parts[1:]:
+            if isinstance(current, dict):
+                current = get(current, part)
+            else:
+                return None
+        return current
+
+    def _ref_parts(self, ref: str) -> Tuple[str, ...]:
+        """Split a dotted reference, memoized since workflows reuse the same refs"""
+        parts = self._ref_parts_cache.get(ref)
+        if parts is None:
+            parts = self._ref_parts_cache[ref] = tuple(ref.split('.'))
+        return parts
 
     def _get_nested(self, obj: Any, path: str) -> Any:
         """Get a nested value from an object using dot notation"""
         if not path:
             return obj
 
-        parts = path.split('.')
+        parts = self._ref_parts(path)
         current = obj
 
         for part in parts:
@@ -741,16 +1296,14 @@ This agent can run automation playbooks defined as JSON, with full variable subs
         # Very basic evaluation for demo
         # In production, use a proper expression parser
         try:
-            # Handle simple comparisons
-            if '>' in condition:
-                parts = condition.split('>')
-                return float(parts[0].strip()) > float(parts[1].strip())
-            elif '<' in condition:
-                parts = condition.split('<')
-                return float(parts[0].strip()) < float(parts[1].strip())
-            elif '==' in condition:
-                parts = condition.split('==')
-                return parts[0].strip() == parts[1].strip()
+            # Handle simple comparisons: numeric when both sides parse, else as strings
+            match = _COND_RE.match(condition)
+            if match:
+                left, op, right = match.groups()
+                try:
+                    return _COND_OPS[op](float(left), float(right))
+                except ValueError:
+                    return _COND_OPS[op](left, right)
             elif condition.lower() in ('true', '1'):
                 return True
             elif condition.lower() in ('false', '0'):
@@ -7,9 +7,11 @@ This script demonstrates the power of the Workflow Runner Agent and IQ Booster s
 
 Run modes:
   python demo_workflow.py              # Interactive menu
+  DEMO_CHOICES="4,5,0" python demo_workflow.py   # Scripted menu choices
   python demo_workflow.py --test       # Run all tests
   python demo_workflow.py --live       # Execute actual IQ boost (PRODUCTION!)
   python demo_workflow.py --api        # Test via HTTP API
+  python demo_workflow.py --api --all  # Send all test prompts concurrently
 
 Requirements:
   - Azure CLI logged in (az login)
@@ -17,17 +19,67 @@ Requirements:
   - For --api mode: func start running
 """
 
+import asyncio
+import http.client
 import os
+import shutil
+import socket
 import sys
 import json
-import subprocess
+import threading
 import time
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
 from typing import Optional
+from urllib.parse import urlsplit
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Add project root to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from utils.azure_clients import get_cli_default_subscription
+
+# Kept-alive API connections by (scheme, host), so repeated API tests skip
+# the TCP + TLS handshake
+_CONNECTIONS = {}
+
+def _post_json(url: str, payload: dict, headers: dict):
+    """
+    POST JSON with http.client and return (status, body text).
+
+    Uses the stdlib rather than requests so the API test doesn't pay for
+    importing requests/urllib3. A reused connection the server has since
+    closed is reopened once.
+    """
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    path = f"{parts.path}?{parts.query}" if parts.query else parts.path
+    body = json.dumps(payload).encode()
+    headers = {"Content-Type": "application/json", **headers}
+
+    for attempt in range(2):
+        conn = _CONNECTIONS.get(key)
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+            conn = _CONNECTIONS[key] = conn_class(parts.netloc, timeout=120)
+        try:
+            conn.request("POST", path, body=body, headers=headers)
+            response = conn.getresponse()
+            return response.status, response.read().decode(errors='replace')
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            del _CONNECTIONS[key]
+            if attempt:
+                raise
+        except Exception:
+            conn.close()
+            del _CONNECTIONS[key]
+            raise
+
 # Colors for terminal output
 class Colors:
     HEADER = '\033[95m'
@@ -39,25 +91,88 @@ class Colors:
     ENDC = '\033[0m'
     BOLD = '\033[1m'
 
+def _dumps(obj) -> str:
+    """Pretty-print JSON with 2-space indents, with orjson when it is installed"""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(obj, indent=2)
+
+# Color prefixes built once instead of formatted on every print
+_HEADER_PFX = Colors.HEADER + Colors.BOLD
+_BAR_LINE = _HEADER_PFX + '=' * 60 + Colors.ENDC
+_STEP_PFX = Colors.CYAN + "▶ "
+_SUCC_PFX = Colors.GREEN + "✅ "
+_ERR_PFX = Colors.RED + "❌ "
+_INFO_PFX = Colors.YELLOW + "ℹ️  "
+_CODE_PFX = Colors.BLUE
+_END = Colors.ENDC
+
 def print_header(text: str):
-    print(f"\n{Colors.HEADER}{Colors.BOLD}{'='*60}{Colors.ENDC}")
-    print(f"{Colors.HEADER}{Colors.BOLD}{text.center(60)}{Colors.ENDC}")
-    print(f"{Colors.HEADER}{Colors.BOLD}{'='*60}{Colors.ENDC}\n")
+    # The whole banner goes out in one write
+    sys.stdout.write(f"\n{_BAR_LINE}\n{_HEADER_PFX}{text.center(60)}{_END}\n{_BAR_LINE}\n\n")
 
 def print_step(text: str):
-    print(f"{Colors.CYAN}▶ {text}{Colors.ENDC}")
+    print(_STEP_PFX, text, _END, sep='')
 
 def print_success(text: str):
-    print(f"{Colors.GREEN}✅ {text}{Colors.ENDC}")
+    print(_SUCC_PFX, text, _END, sep='')
 
 def print_error(text: str):
-    print(f"{Colors.RED}❌ {text}{Colors.ENDC}")
+    print(_ERR_PFX, text, _END, sep='')
 
 def print_info(text: str):
-    print(f"{Colors.YELLOW}ℹ️  {text}{Colors.ENDC}")
+    print(_INFO_PFX, text, _END, sep='')
 
 def print_code(text: str):
-    print(f"{Colors.BLUE}{text}{Colors.ENDC}")
+    write = sys.stdout.write
+    write(_CODE_PFX)
+    write(text)
+    write(_END + "\n")
+
+def _clip(text: str, n: int = 2000) -> str:
+    """text cut to n characters, with '...' when anything was cut"""
+    return text if len(text) <= n else f"{text[:n]}..."
+
+class _ThreadOutput:
+    """sys.stdout stand-in that sends a worker thread's prints to its own buffer"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def capture(self, func):
+        """Run func, returning (result, everything it printed)"""
+        self._local.buffer = StringIO()
+        try:
+            return func(), self._local.buffer.getvalue()
+        finally:
+            del self._local.buffer
+
+    def write(self, text):
+        return getattr(self._local, 'buffer', self._stream).write(text)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+# Agents are reused across calls on the same thread; they keep per-run state,
+# so the concurrent test runner's worker threads each get their own
+_agents_local = threading.local()
+
+def _workflow_agent():
+    """This thread's WorkflowRunnerAgent"""
+    agent = getattr(_agents_local, 'workflow_runner', None)
+    if agent is None:
+        from agents.workflow_runner_agent import WorkflowRunnerAgent
+        agent = _agents_local.workflow_runner = WorkflowRunnerAgent()
+    return agent
+
+def _iq_booster_agent():
+    """This thread's IQBoosterAgent"""
+    agent = getattr(_agents_local, 'iq_booster', None)
+    if agent is None:
+        from agents.iq_booster_agent import IQBoosterAgent
+        agent = _agents_local.iq_booster = IQBoosterAgent()
+    return agent
 
 # ============================================================================
 # Test Functions
@@ -71,12 +186,10 @@ def test_imports():
         from agents.basic_agent import BasicAgent
         print_success("BasicAgent imported")
 
-        from agents.iq_booster_agent import IQBoosterAgent
-        agent = IQBoosterAgent()
+        agent = _iq_booster_agent()
         print_success(f"IQBoosterAgent imported: {agent.name}")
 
-        from agents.workflow_runner_agent import WorkflowRunnerAgent
-        agent = WorkflowRunnerAgent()
+        agent = _workflow_agent()
         print_success(f"WorkflowRunnerAgent imported: {agent.name}")
 
         return True
@@ -89,8 +202,7 @@ def test_workflow_list():
     print_step("Testing workflow listing...")
 
     try:
-        from agents.workflow_runner_agent import WorkflowRunnerAgent
-        agent = WorkflowRunnerAgent()
+        agent = _workflow_agent()
 
         result = agent.perform(action='list')
         print_code(result)
@@ -110,11 +222,10 @@ def test_workflow_describe():
     print_step("Testing workflow description...")
 
     try:
-        from agents.workflow_runner_agent import WorkflowRunnerAgent
-        agent = WorkflowRunnerAgent()
+        agent = _workflow_agent()
 
         result = agent.perform(action='describe', workflow_name='iq_boost_workflow')
-        print_code(result[:1500] + "..." if len(result) > 1500 else result)
+        print_code(_clip(result, 1500))
 
         print_success("Workflow describe works!")
         return True
@@ -127,8 +238,7 @@ def test_workflow_validate():
     print_step("Testing workflow validation...")
 
     try:
-        from agents.workflow_runner_agent import WorkflowRunnerAgent
-        agent = WorkflowRunnerAgent()
+        agent = _workflow_agent()
 
         result = agent.perform(action='validate', workflow_name='iq_boost_workflow')
         print_code(result)
@@ -148,8 +258,7 @@ def test_workflow_dry_run():
     print_step("Testing workflow dry-run...")
 
     try:
-        from agents.workflow_runner_agent import WorkflowRunnerAgent
-        agent = WorkflowRunnerAgent()
+        agent = _workflow_agent()
 
         result = agent.perform(
             action='dry_run',
@@ -159,7 +268,7 @@ def test_workflow_dry_run():
                 'resource_group': 'rappai'
             }
         )
-        print_code(result[:2000] + "..." if len(result) > 2000 else result)
+        print_code(_clip(result))
 
         print_success("Workflow dry-run works!")
         return True
@@ -172,8 +281,7 @@ def test_iq_booster_status():
     print_step("Testing IQ Booster status...")
 
     try:
-        from agents.iq_booster_agent import IQBoosterAgent
-        agent = IQBoosterAgent()
+        agent = _iq_booster_agent()
 
         result = agent.perform(action='status')
         print_code(result)
@@ -189,11 +297,10 @@ def test_iq_booster_discover():
     print_step("Testing IQ Booster resource discovery...")
 
     try:
-        from agents.iq_booster_agent import IQBoosterAgent
-        agent = IQBoosterAgent()
+        agent = _iq_booster_agent()
 
         result = agent.perform(action='discover_resources')
-        print_code(result[:2000] + "..." if len(result) > 2000 else result)
+        print_code(_clip(result))
 
         print_success("IQ Booster discovery works!")
         return True
@@ -201,18 +308,53 @@ def test_iq_booster_discover():
         print_error(f"Test failed: {e}")
         return False
 
+# Resolve the az CLI once instead of searching PATH on every call (on
+# Windows it is the az.cmd shim, which exec can't find by its bare name)
+_AZ_BIN = shutil.which('az') or 'az'
+
+def _read_az_account() -> Optional[dict]:
+    """
+    Read the default Azure CLI account from azureProfile.json, avoiding the
+    ~1-2s `az` start-up.
+
+    Returns {'name', 'user'} for the default subscription, {} when no
+    subscription is selected (logged out), or None when there is no profile.
+    """
+    subscription = get_cli_default_subscription()
+    if not subscription:
+        return subscription
+    return {'name': subscription.get('name'), 'user': (subscription.get('user') or {}).get('name')}
+
+async def _az_json(*args, timeout=10):
+    """
+    Run an az command without blocking the event loop; returns its parsed JSON
+    output, or None if it failed.
+
+    Several calls can be overlapped with asyncio.gather.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        _AZ_BIN, *args, '-o', 'json',
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+    )
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise
+    return json.loads(stdout) if proc.returncode == 0 else None
+
 def test_azure_cli():
     """Test Azure CLI connectivity"""
     print_step("Testing Azure CLI...")
 
     try:
-        result = subprocess.run(
-            ['az', 'account', 'show', '--query', '{name:name, user:user.name}', '-o', 'json'],
-            capture_output=True, text=True, timeout=10
-        )
+        account = _read_az_account()
+        if account is None:
+            # No profile file to read; ask the CLI
+            account = asyncio.run(_az_json('account', 'show', '--query', '{name:name, user:user.name}')) or {}
 
-        if result.returncode == 0:
-            account = json.loads(result.stdout)
+        if account:
             print_success(f"Azure CLI connected as: {account.get('user', 'Unknown')}")
             print_info(f"Subscription: {account.get('name', 'Unknown')}")
             return True
@@ -246,8 +388,7 @@ def run_live_boost():
     print_step("Executing IQ Boost workflow...")
 
     try:
-        from agents.workflow_runner_agent import WorkflowRunnerAgent
-        agent = WorkflowRunnerAgent()
+        agent = _workflow_agent()
 
         result = agent.perform(
             action='run',
@@ -279,8 +420,7 @@ def run_live_iq_boost():
     print_step("Executing IQ Boost via agent...")
 
     try:
-        from agents.iq_booster_agent import IQBoosterAgent
-        agent = IQBoosterAgent()
+        agent = _iq_booster_agent()
 
         result = agent.perform(action='boost')
         print("\n" + result)
@@ -292,15 +432,21 @@ def run_live_iq_boost():
 # API Testing
 # ============================================================================
 
-def test_api_call():
-    """Test via HTTP API"""
-    print_header("🌐 API Test")
+API_URL = "https://copilot365-4ovzneuimhd2g.azurewebsites.net/api/businessinsightbot_function"
+LOCAL_URL = "http://localhost:7071/api/businessinsightbot_function"
 
-    # Configuration - API key should be set via environment variable
-    API_URL = "https://copilot365-4ovzneuimhd2g.azurewebsites.net/api/businessinsightbot_function"
-    API_KEY = os.environ.get("COPILOT365_API_KEY", "")  # Set via: export COPILOT365_API_KEY=your_key
+# Test prompts
+API_PROMPTS = [
+    "What's your current status?",
+    "List available workflows",
+    "Show me your IQ booster capabilities",
+    "Discover my Azure OpenAI resources"
+]
 
-    LOCAL_URL = "http://localhost:7071/api/businessinsightbot_function"
+def _choose_api_endpoint():
+    """Ask for local or production; returns (url, extra headers)"""
+    # API key should be set via environment variable
+    API_KEY = os.environ.get("COPILOT365_API_KEY", "")  # Set via: export COPILOT365_API_KEY=your_key
 
     print_info("Choose endpoint:")
     print("  1. Local (localhost:7071)")
@@ -309,19 +455,18 @@ def test_api_call():
     choice = input("\nChoice [1/2]: ").strip()
 
     url = LOCAL_URL if choice == '1' else API_URL
-    headers = {"Content-Type": "application/json"}
-    if choice == '2':
-        headers["x-functions-key"] = API_KEY
+    headers = {"x-functions-key": API_KEY} if choice == '2' else {}
 
     print_info(f"Using: {url}")
+    return url, headers
 
-    # Test prompts
-    prompts = [
-        "What's your current status?",
-        "List available workflows",
-        "Show me your IQ booster capabilities",
-        "Discover my Azure OpenAI resources"
-    ]
+def test_api_call():
+    """Test via HTTP API"""
+    print_header("🌐 API Test")
+
+    url, headers = _choose_api_endpoint()
+
+    prompts = API_PROMPTS
 
     print_info("\nSelect a test prompt:")
     for i, p in enumerate(prompts, 1):
@@ -348,14 +493,14 @@ def test_api_call():
 
     try:
         start = time.time()
-        response = requests.post(url, json=payload, headers=headers, timeout=120)
+        status, text = _post_json(url, payload, headers)
         elapsed = time.time() - start
 
         print_info(f"Response time: {elapsed:.2f}s")
-        print_info(f"Status code: {response.status_code}")
+        print_info(f"Status code: {status}")
 
-        if response.status_code == 200:
-            data = response.json()
+        if status == 200:
+            data = json.loads(text)
             print_success("Response received!")
             print("\n" + "="*60)
             print(data.get('assistant_response', 'No response'))
@@ -365,14 +510,58 @@ def test_api_call():
                 print(f"\n{Colors.YELLOW}Agent Logs:{Colors.ENDC}")
                 print(data.get('agent_logs'))
         else:
-            print_error(f"API error: {response.text}")
+            print_error(f"API error: {text}")
 
-    except requests.exceptions.ConnectionError:
+    except (ConnectionError, socket.gaierror):
         print_error("Connection failed. Is the function running?")
         print_info("Start locally with: func start")
     except Exception as e:
         print_error(f"Request failed: {e}")
 
+async def _fire_all(url, headers, prompts):
+    """Send every prompt at once; returns (prompt, response or exception, seconds) per prompt"""
+    import httpx
+
+    # HTTP/2 multiplexes the requests over one connection when h2 is installed
+    try:
+        import h2  # noqa: F401
+        http2 = True
+    except ImportError:
+        http2 = False
+
+    async with httpx.AsyncClient(http2=http2, timeout=120) as client:
+        async def send(prompt):
+            start = time.time()
+            try:
+                response = await client.post(url, json={"user_input": prompt, "conversation_history": []}, headers=headers)
+            except Exception as e:
+                response = e
+            return prompt, response, time.time() - start
+
+        return await asyncio.gather(*(send(p) for p in prompts))
+
+def test_api_all():
+    """Send all test prompts concurrently via the HTTP API"""
+    print_header("🌐 API Test (all prompts)")
+
+    url, headers = _choose_api_endpoint()
+    print_step(f"Sending {len(API_PROMPTS)} prompts concurrently...")
+
+    start = time.time()
+    results = asyncio.run(_fire_all(url, headers, API_PROMPTS))
+    print_info(f"Total time: {time.time() - start:.2f}s")
+
+    for prompt, response, elapsed in results:
+        print()
+        print_step(f"{prompt} ({elapsed:.2f}s)")
+        if isinstance(response, Exception):
+            print_error(f"Request failed: {response}")
+        elif response.status_code == 200:
+            print_success("Response received!")
+            print(response.json().get('assistant_response', 'No response'))
+        else:
+            print_error(f"API error {response.status_code}: {response.text}")
+
 # ============================================================================
 # Demo Scenarios
 # ============================================================================
@@ -413,13 +602,12 @@ def demo_workflow_creation():
         }
     }
 
-    print_code(json.dumps(workflow, indent=2))
+    print_code(_dumps(workflow))
 
     print_step("\nRunning demo workflow...")
 
     try:
-        from agents.workflow_runner_agent import WorkflowRunnerAgent
-        agent = WorkflowRunnerAgent()
+        agent = _workflow_agent()
 
         result = agent.perform(
             action='run',
@@ -454,16 +642,29 @@ def run_all_tests():
 
     results = []
 
-    for name, test_func in tests:
-        print_header(f"Test: {name}")
+    def run_test(test_func):
         try:
-            success = test_func()
-            results.append((name, success))
+            return test_func()
         except Exception as e:
             print_error(f"Test crashed: {e}")
-            results.append((name, False))
+            return False
 
-        print()  # Spacing
+    # The tests are independent and mostly wait on az / Azure, so run them
+    # concurrently; each one's output is buffered and printed in order
+    output = _ThreadOutput(sys.stdout)
+    sys.stdout = output
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(output.capture, lambda f=test_func: run_test(f)) for _, test_func in tests]
+            for (name, _), future in zip(tests, futures):
+                success, printed = future.result()
+                print_header(f"Test: {name}")
+                print(printed, end='')
+                results.append((name, success))
+
+                print()  # Spacing
+    finally:
+        sys.stdout = output._stream
 
     # Summary
     print_header("📊 Test Summary")
@@ -482,12 +683,8 @@ def run_all_tests():
     else:
         print_error(f"\n⚠️  {total - passed} test(s) failed")
 
-def interactive_menu():
-    """Interactive menu"""
-    while True:
-        print_header("🎭 Workflow Runner Demo")
-
-        print(f"""
+# Menu body, formatted once at import
+_MENU_TEXT = f"""
 {Colors.CYAN}Testing:{Colors.ENDC}
   1. Run all tests
   2. Test agent imports
@@ -515,9 +712,32 @@ def interactive_menu():
   14. Demo custom workflow creation
 
 {Colors.YELLOW}0. Exit{Colors.ENDC}
-""")
+"""
+
+def interactive_menu():
+    """
+    Interactive menu.
 
-        choice = input("Select option: ").strip()
+    DEMO_CHOICES="1,3,0" drives the menu unattended (e.g. under a profiler):
+    the options are taken in order, with no pause between them, and the menu
+    exits when they run out. Piped stdin also exits cleanly at end of input.
+    """
+    scripted = os.environ.get("DEMO_CHOICES")
+    choices = iter(c.strip() for c in scripted.split(',')) if scripted else None
+
+    while True:
+        print_header("🎭 Workflow Runner Demo")
+
+        print(_MENU_TEXT)
+
+        if choices is not None:
+            choice = next(choices, '0')
+            print(f"Select option: {choice}")
+        else:
+            try:
+                choice = input("Select option: ").strip()
+            except EOFError:
+                choice = '0'
 
         if choice == '0':
             print_info("Goodbye!")
@@ -541,8 +761,7 @@ def interactive_menu():
         elif choice == '9':
             test_iq_booster_discover()
         elif choice == '10':
-            from agents.iq_booster_agent import IQBoosterAgent
-            agent = IQBoosterAgent()
+            agent = _iq_booster_agent()
             result = agent.perform(action='boost', dry_run=True)
             print(result)
         elif choice == '11':
@@ -556,7 +775,11 @@ def interactive_menu():
         else:
             print_error("Invalid option")
 
-        input(f"\n{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
+        if choices is None:
+            try:
+                input(f"\n{Colors.YELLOW}Press Enter to continue...{Colors.ENDC}")
+            except EOFError:
+                pass
 
 # ============================================================================
 # Entry Point
@@ -572,7 +795,10 @@ if __name__ == "__main__":
         elif arg in ('--live', '-l'):
             run_live_iq_boost()
         elif arg in ('--api', '-a'):
-            test_api_call()
+            if '--all' in sys.argv[2:]:
+                test_api_all()
+            else:
+                test_api_call()
         elif arg in ('--help', '-h'):
             print(__doc__)
         else:
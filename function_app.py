@@ -14,6 +14,7 @@ from datetime import datetime
 import time
 from utils.azure_file_storage import safe_json_loads
 from utils.storage_factory import get_storage_manager
+from utils.tokenizer import CalibratedTokenizer, get_default_tokenizer
 
 # Universal Identifier (UID) for AI-to-AI collaboration
 # INTENTIONALLY not a valid UUID (contains non-hex chars 'p')
@@ -528,7 +529,7 @@ Revenue's up 12 percent and customers are happier - looking good for Q3.
             
         return messages
     
-    def get_openai_api_call(self, messages):
+    def get_openai_api_call(self, messages, calibrate=False):
         try:
             # Get the deployment name from environment or use default
             deployment_name = os.environ.get('AZURE_OPENAI_DEPLOYMENT_NAME', 'gpt-deployment')
@@ -549,12 +550,30 @@ Revenue's up 12 percent and customers are happier - looking good for Q3.
                 api_params["tool_choice"] = "auto"
 
             response = self.client.chat.completions.create(**api_params)
+            if calibrate:
+                self.calibrate_tokenizer(api_params, response)
             return response
         except Exception as e:
             logging.error(f"Error in OpenAI API call: {str(e)}")
             logging.error(f"Deployment: {os.environ.get('AZURE_OPENAI_DEPLOYMENT_NAME', 'gpt-deployment')}")
             logging.error(f"Endpoint: {os.environ.get('AZURE_OPENAI_ENDPOINT', 'not set')}")
             raise
+
+    def calibrate_tokenizer(self, api_params, response):
+        """Feed the real prompt_tokens back into the shared token estimator"""
+        tokenizer = get_default_tokenizer()
+        if not isinstance(tokenizer, CalibratedTokenizer):
+            return
+        try:
+            prompt_tokens = getattr(getattr(response, 'usage', None), 'prompt_tokens', None)
+            if not isinstance(prompt_tokens, int):
+                return
+            # Measure the serialized payload that was sent, tool schema included
+            payload = {key: api_params[key] for key in ('messages', 'tools') if key in api_params}
+            char_count = len(json.dumps(payload, ensure_ascii=False))
+            tokenizer.calibrate(char_count, prompt_tokens)
+        except Exception as e:
+            logging.debug(f"Tokenizer calibration skipped: {e}")
     
     def parse_response_with_voice(self, content):
         """Parse the response to extract formatted and voice parts"""
@@ -726,10 +745,13 @@ Revenue's up 12 percent and customers are happier - looking good for Q3.
         agent_logs = []
         retry_count = 0
         needs_follow_up = False
+        calibrated = False
 
         while retry_count < max_retries:
             try:
-                response = self.get_openai_api_call(messages)
+                # One calibration sample per request; follow-up calls resend the same prefix
+                response = self.get_openai_api_call(messages, calibrate=not calibrated)
+                calibrated = True
                 assistant_msg = response.choices[0].message
                 msg_contents = assistant_msg.content or ""  # Ensure content is never None
 
@@ -10,6 +10,9 @@ Usage:
 Or with verbose output:
     python run_pre_deployment_tests.py -v
 
+Show this help:
+    python run_pre_deployment_tests.py --help
+
 This script runs:
 1. Deployment readiness tests (configuration, imports, syntax)
 2. Unit tests (functionality)
@@ -19,8 +22,18 @@ This script runs:
 import subprocess
 import sys
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from importlib.util import find_spec
+import xml.etree.ElementTree as ET
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Colors for terminal output
 class Colors:
     GREEN = '\033[92m'
@@ -37,71 +50,100 @@ def print_header(text):
     print(f"{Colors.BOLD}{Colors.BLUE}{'=' * 60}{Colors.END}\n")
 
 
-def print_success(text):
-    print(f"{Colors.GREEN}✓ {text}{Colors.END}")
+def print_success(text, file=None):
+    print(f"{Colors.GREEN}✓ {text}{Colors.END}", file=file)
+
 
+def print_failure(text, file=None):
+    print(f"{Colors.RED}✗ {text}{Colors.END}", file=file)
 
-def print_failure(text):
-    print(f"{Colors.RED}✗ {text}{Colors.END}")
 
+def print_warning(text, file=None):
+    print(f"{Colors.YELLOW}⚠ {text}{Colors.END}", file=file)
 
-def print_warning(text):
-    print(f"{Colors.YELLOW}⚠ {text}{Colors.END}")
 
+def run_pytest(test_paths, verbose=False, junit_xml=None):
+    """
+    Run pytest once on the specified paths.
 
-def run_pytest(test_path, verbose=False):
-    """Run pytest on the specified path"""
-    args = [sys.executable, "-m", "pytest", test_path]
+    Output is streamed line by line (echoed in verbose mode, dropped
+    otherwise) rather than buffered until pytest exits.
+    """
+    args = [sys.executable, "-m", "pytest", *test_paths]
     if verbose:
         args.append("-v")
     args.extend(["--tb=short", "-q"])
+    if junit_xml:
+        args.append(f"--junitxml={junit_xml}")
+
+    with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1) as proc:
+        for line in proc.stdout:
+            if verbose:
+                sys.stdout.write(line)
+    return proc.returncode == 0
 
-    result = subprocess.run(args, capture_output=True, text=True)
-    return result.returncode == 0, result.stdout, result.stderr
 
+def failed_test_modules(junit_xml):
+    """Names of the test modules with a failed or errored test in a JUnit XML report"""
+    failed = set()
+    for case in ET.parse(junit_xml).iter("testcase"):
+        if case.find("failure") is not None or case.find("error") is not None:
+            # Collection errors have no classname; the module is in the name
+            dotted = case.get("classname") or case.get("name", "")
+            failed.update(dotted.split("."))
+    return failed
 
-def check_python_version():
+
+def check_python_version(file=None):
     """Check Python version compatibility"""
     version = sys.version_info
     if version.major != 3 or version.minor < 11:
-        print_warning(f"Python {version.major}.{version.minor} detected. Python 3.11 is recommended for Azure Functions v4.")
+        print_warning(f"Python {version.major}.{version.minor} detected. Python 3.11 is recommended for Azure Functions v4.", file=file)
         return False
-    print_success(f"Python {version.major}.{version.minor}.{version.micro} detected")
+    print_success(f"Python {version.major}.{version.minor}.{version.micro} detected", file=file)
     return True
 
 
-def check_dependencies():
+def check_dependencies(file=None):
     """Check if all required dependencies are installed"""
     required = ['azure.functions', 'openai', 'azure.identity', 'azure.storage.fileshare']
     missing = []
 
+    # find_spec locates the package without running its (slow) module init
     for package in required:
         try:
-            __import__(package)
+            if find_spec(package) is None:
+                missing.append(package)
         except ImportError:
+            # Parent package (e.g. azure) not installed
             missing.append(package)
 
     if missing:
-        print_failure(f"Missing dependencies: {', '.join(missing)}")
-        print(f"  Run: pip install -r requirements.txt")
+        print_failure(f"Missing dependencies: {', '.join(missing)}", file=file)
+        print(f"  Run: pip install -r requirements.txt", file=file)
         return False
 
-    print_success("All required dependencies installed")
+    print_success("All required dependencies installed", file=file)
     return True
 
 
-def check_local_settings():
+def check_local_settings(file=None):
     """Check if local.settings.json exists and has required keys"""
     project_root = Path(__file__).parent
     settings_path = project_root / "local.settings.json"
 
-    if not settings_path.exists():
-        print_warning("local.settings.json not found (required for local testing)")
+    try:
+        with open(settings_path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        print_warning("local.settings.json not found (required for local testing)", file=file)
         return True  # Not a failure, just a warning
 
-    import json
-    with open(settings_path, 'r') as f:
-        config = json.load(f)
+    if orjson:
+        config = orjson.loads(data)
+    else:
+        import json
+        config = json.loads(data)
 
     values = config.get("Values", {})
     required_keys = [
@@ -112,14 +154,19 @@ def check_local_settings():
 
     missing = [k for k in required_keys if not values.get(k) or values.get(k).startswith("<")]
     if missing:
-        print_warning(f"local.settings.json missing or has placeholder values for: {', '.join(missing)}")
+        print_warning(f"local.settings.json missing or has placeholder values for: {', '.join(missing)}", file=file)
         return True  # Warning, not failure
 
-    print_success("local.settings.json configured correctly")
+    print_success("local.settings.json configured correctly", file=file)
     return True
 
 
 def main():
+    # Print usage before any dependency checks or test imports
+    if "-h" in sys.argv or "--help" in sys.argv:
+        print(__doc__)
+        return 0
+
     verbose = "-v" in sys.argv or "--verbose" in sys.argv
 
     print_header("PRE-DEPLOYMENT TEST SUITE")
@@ -131,45 +178,53 @@ def main():
     # 1. Environment Checks
     print_header("ENVIRONMENT CHECKS")
 
-    results["python_version"] = check_python_version()
-    results["dependencies"] = check_dependencies()
-    results["local_settings"] = check_local_settings()
-
-    # 2. Deployment Readiness Tests
-    print_header("DEPLOYMENT READINESS TESTS")
-
-    test_file = project_root / "tests" / "test_deployment_readiness.py"
-    if test_file.exists():
-        passed, stdout, stderr = run_pytest(str(test_file), verbose)
-        results["deployment_readiness"] = passed
-        if passed:
-            print_success("All deployment readiness tests passed")
-        else:
-            print_failure("Some deployment readiness tests failed")
-            if verbose:
-                print(stdout)
-                print(stderr)
-    else:
-        print_warning("test_deployment_readiness.py not found")
-        results["deployment_readiness"] = True
-
-    # 3. Unit Tests
-    print_header("UNIT TESTS")
-
-    unit_test_file = project_root / "tests" / "test_function_app.py"
-    if unit_test_file.exists():
-        passed, stdout, stderr = run_pytest(str(unit_test_file), verbose)
-        results["unit_tests"] = passed
-        if passed:
-            print_success("All unit tests passed")
+    # The checks are independent, so run them together; each one prints into
+    # its own buffer, flushed in order once all have finished
+    checks = [
+        ("python_version", check_python_version),
+        ("dependencies", check_dependencies),
+        ("local_settings", check_local_settings),
+    ]
+    buffers = {name: StringIO() for name, _ in checks}
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = {name: executor.submit(check, file=buffers[name]) for name, check in checks}
+    for name, _ in checks:
+        sys.stdout.write(buffers[name].getvalue())
+        results[name] = futures[name].result()
+
+    # 2-3. Deployment readiness and unit tests, in a single pytest run
+    suites = [
+        ("deployment_readiness", "DEPLOYMENT READINESS TESTS", project_root / "tests" / "test_deployment_readiness.py",
+         "All deployment readiness tests passed", "Some deployment readiness tests failed"),
+        ("unit_tests", "UNIT TESTS", project_root / "tests" / "test_function_app.py",
+         "All unit tests passed", "Some unit tests failed"),
+    ]
+    paths = [str(test_file) for _, _, test_file, _, _ in suites if test_file.exists()]
+    failed_modules = set()
+    if paths:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            junit_xml = os.path.join(tmp_dir, "report.xml")
+            passed = run_pytest(paths, verbose, junit_xml)
+            try:
+                failed_modules = failed_test_modules(junit_xml)
+            except (OSError, ET.ParseError):
+                # pytest died before writing the report; blame every suite
+                failed_modules = {Path(path).stem for path in paths}
+            if not passed and not failed_modules:
+                failed_modules = {Path(path).stem for path in paths}
+
+    for key, title, test_file, passed_msg, failed_msg in suites:
+        print_header(title)
+        if not test_file.exists():
+            print_warning(f"{test_file.name} not found")
+            results[key] = True
+            continue
+
+        results[key] = test_file.stem not in failed_modules
+        if results[key]:
+            print_success(passed_msg)
         else:
-            print_failure("Some unit tests failed")
-            if verbose:
-                print(stdout)
-                print(stderr)
-    else:
-        print_warning("test_function_app.py not found")
-        results["unit_tests"] = True
+            print_failure(failed_msg)
 
     # 4. Storage Tests (optional)
     print_header("STORAGE TESTS")
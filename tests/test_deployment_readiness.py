@@ -77,6 +77,20 @@ class TestRequiredDependencies:
         assert azure.storage.blob is not None
 
 
+def _syntax_errors(directory):
+    """Syntax errors in a directory's .py files (skipping __*), one "name: error" entry each"""
+    errors = []
+    for path in sorted(Path(directory).glob("*.py")):
+        if path.name.startswith("__"):
+            continue
+        try:
+            # Compiled from bytes so compile() handles the encoding declaration
+            compile(path.read_bytes(), path.name, 'exec')
+        except SyntaxError as e:
+            errors.append(f"{path.name}: {e}")
+    return errors
+
+
 class TestCodeSyntax:
     """Verify code files have valid syntax"""
 
@@ -90,27 +104,15 @@ class TestCodeSyntax:
 
     def test_agents_syntax(self):
         """All agent files must have valid syntax"""
-        agents_dir = project_root / "agents"
-        for agent_file in agents_dir.glob("*.py"):
-            if agent_file.name.startswith("__"):
-                continue
-            try:
-                with open(agent_file, 'r') as f:
-                    compile(f.read(), agent_file, 'exec')
-            except SyntaxError as e:
-                pytest.fail(f"Syntax error in {agent_file.name}: {e}")
+        errors = _syntax_errors(project_root / "agents")
+        if errors:
+            pytest.fail("Syntax errors in agents:\n" + "\n".join(errors))
 
     def test_utils_syntax(self):
         """All utility files must have valid syntax"""
-        utils_dir = project_root / "utils"
-        for util_file in utils_dir.glob("*.py"):
-            if util_file.name.startswith("__"):
-                continue
-            try:
-                with open(util_file, 'r') as f:
-                    compile(f.read(), util_file, 'exec')
-            except SyntaxError as e:
-                pytest.fail(f"Syntax error in {util_file.name}: {e}")
+        errors = _syntax_errors(project_root / "utils")
+        if errors:
+            pytest.fail("Syntax errors in utils:\n" + "\n".join(errors))
 
 
 class TestOpenAIApiFormat:
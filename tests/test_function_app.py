@@ -12,6 +12,7 @@ import pytest
 import json
 import os
 import sys
+from collections import Counter
 from unittest.mock import Mock, patch, MagicMock
 from pathlib import Path
 
@@ -264,6 +265,36 @@ class TestSafeJsonLoads:
         assert result == input_dict
 
 
+class TestTokenizer:
+    """Tests for token estimation utilities"""
+
+    def test_structured_length_sums_keys_and_leaves(self):
+        from utils.tokenizer import structured_length
+        assert structured_length({"ab": "cdef", "n": [1, None, "xy"]}) == 2 + 4 + 1 + 1 + 2
+
+    def test_calibrated_tokenizer_default_ratio(self):
+        from utils.tokenizer import CalibratedTokenizer
+        tokenizer = CalibratedTokenizer()
+        assert tokenizer.count_text("a" * 400) == 100
+        assert tokenizer.count_text("") == 1
+
+    def test_calibrated_tokenizer_moves_toward_observed_ratio(self):
+        from utils.tokenizer import CalibratedTokenizer
+        tokenizer = CalibratedTokenizer(tokens_per_char=0.25, alpha=0.5)
+        tokenizer.calibrate(1000, 500)
+        assert tokenizer.tokens_per_char == pytest.approx(0.375)
+        tokenizer.calibrate(0, 500)
+        assert tokenizer.tokens_per_char == pytest.approx(0.375)
+
+    def test_count_lengths_matches_per_text_counts(self):
+        from utils.tokenizer import CalibratedTokenizer, VECTORIZE_MIN_ITEMS
+        tokenizer = CalibratedTokenizer()
+        texts = ["x" * (i % 37) for i in range(VECTORIZE_MIN_ITEMS + 10)]
+        expected = sum(tokenizer.count_text(t) for t in texts)
+        assert tokenizer.count_lengths(len(t) for t in texts) == expected
+        assert tokenizer.count_lengths(len(t) for t in texts[:5]) == sum(tokenizer.count_text(t) for t in texts[:5])
+
+
 class TestGuidValidation:
     """Tests for GUID validation and extraction"""
 
@@ -466,6 +497,17 @@ class TestLocalStorageManager:
         assert result is False
         assert storage.current_guid is None
 
+    def test_local_storage_memory_size(self, tmp_path):
+        """Test memory size is reported without reading the file"""
+        from utils.local_file_storage import LocalFileStorageManager
+
+        storage = LocalFileStorageManager(base_path=str(tmp_path / ".local_storage"))
+        assert storage.get_memory_size() == len("{}")
+
+        storage.write_json({"key": "value"})
+        memory_file = os.path.join(storage.base_path, "shared_memories", "memory.json")
+        assert storage.get_memory_size() == os.path.getsize(memory_file)
+
 
 class TestAgentLoading:
     """Tests for agent loading functionality"""
@@ -615,6 +657,577 @@ class TestIntegrationScenarios:
         assert assistant_msg.tool_calls[0].function.name == "TestAgent"
 
 
+class TestWorkflowRunner:
+    """Tests for WorkflowRunnerAgent runs using template/evaluate steps"""
+
+    @pytest.fixture
+    def runner(self, tmp_path):
+        from agents.workflow_runner_agent import WorkflowRunnerAgent
+        agent = WorkflowRunnerAgent()
+        agent.workflows_dir = str(tmp_path / "workflows")
+        agent.step_cache_dir = str(tmp_path / "cache")
+        os.makedirs(agent.workflows_dir)
+        return agent
+
+    def write_workflow(self, runner, name, workflow):
+        path = os.path.join(runner.workflows_dir, name + ".json")
+        with open(path, "w") as f:
+            json.dump(workflow, f)
+        return path
+
+    def test_run_template_and_evaluate(self, runner):
+        workflow = {
+            "name": "Pick Model",
+            "variables": {"models": {"default": [{"name": "gpt-4o"}, {"name": "gpt-5"}]}},
+            "steps": [
+                {"id": "pick", "action": "evaluate", "outputs": {"model": "$.name"},
+                 "logic": {"type": "priority_match", "source": "models",
+                           "priorities": ["gpt-5", "gpt-4o"], "match_field": "name"}},
+                {"id": "msg", "action": "template", "template": "Using ${pick.model}",
+                 "outputs": {"text": "$"}}
+            ],
+            "on_complete": {"action": "return", "value": "${msg.text}"}
+        }
+        result = runner.perform(action="run", workflow_json=workflow)
+        assert "# 🚀 Running: Pick Model" in result
+        assert result.endswith("Using gpt-5")
+
+    def test_dead_template_step_is_skipped(self, runner):
+        workflow = {
+            "steps": [
+                {"id": "unused", "action": "template", "template": "x", "outputs": {"text": "$"}},
+                {"id": "used", "action": "template", "template": "y", "outputs": {"text": "$"}}
+            ],
+            "on_complete": {"action": "return", "value": "${used.text}"}
+        }
+        result = runner.perform(action="run", workflow_json=workflow)
+        assert "## Step 1: unused\n⏭️ Skipped (outputs unused)" in result
+        assert runner.step_outputs["unused"] == {}
+        assert runner.step_outputs["used"] == {"text": "y"}
+
+    def test_parallel_abort_halts_later_steps(self, runner):
+        workflow = {
+            "parallel": True,
+            "variables": {"models": {"default": [{"name": "gpt-35"}]}},
+            "steps": [
+                {"id": "pick", "action": "evaluate", "outputs": {"model": "$.name"},
+                 "logic": {"type": "priority_match", "source": "models",
+                           "priorities": ["gpt-5"], "match_field": "name"}},
+                {"id": "msg", "action": "template", "template": "${pick.model}", "outputs": {"text": "$"}},
+                {"id": "final", "action": "template", "template": "${msg.text}", "outputs": {"text": "$"}}
+            ],
+            "on_complete": {"action": "return", "value": "${final.text}"}
+        }
+        result = runner.perform(action="run", workflow_json=workflow)
+        assert "**Workflow aborted:** No matching item found" in result
+        assert "## Step 2" not in result
+        assert "msg" not in runner.step_outputs
+        assert "final" not in runner.step_outputs
+
+    def test_parallel_reports_in_workflow_order(self, runner):
+        import functools
+        import time
+        from agents.workflow_runner_agent import WorkflowRunnerAgent
+
+        original = WorkflowRunnerAgent._exec_template
+
+        @functools.wraps(original)
+        def slow_first(self, step):
+            if step.get("id") == "first":
+                time.sleep(0.2)
+            return original(self, step)
+
+        workflow = {
+            "parallel": True,
+            "steps": [
+                {"id": name, "action": "template", "template": name, "outputs": {"text": "$"}}
+                for name in ("first", "second", "third")
+            ],
+            "on_complete": {"action": "return", "value": "${first.text} ${second.text} ${third.text}"}
+        }
+        with patch.object(WorkflowRunnerAgent, "_exec_template", slow_first):
+            result = runner.perform(action="run", workflow_json=workflow)
+        positions = [result.index(f"## Step {i}: {name}") for i, name in enumerate(("first", "second", "third"), 1)]
+        assert positions == sorted(positions)
+        assert result.endswith("first second third")
+
+    def test_parallel_validation_gates_dependents(self, runner):
+        workflow = {
+            "parallel": True,
+            "steps": [
+                {"id": "check", "action": "template", "template": "no", "outputs": {"value": "$"},
+                 "validation": {"condition": "${check.value} == yes", "error_message": "Not ready"}},
+                {"id": "next", "action": "template", "template": "${check.value}", "outputs": {"text": "$"}}
+            ],
+            "on_complete": {"action": "return", "value": "${next.text}"}
+        }
+        result = runner.perform(action="run", workflow_json=workflow)
+        assert "⚠️ Validation failed: Not ready" in result
+        assert "## Step 2" not in result
+        assert "next" not in runner.step_outputs
+
+    def test_sensitive_outputs_stay_out_of_step_cache(self, runner):
+        self.write_workflow(runner, "secrets", {
+            "variables": {"key": {"default": "s3cr3t"}},
+            "steps": [
+                {"id": "secret", "action": "template", "template": "${key}", "sensitive": True,
+                 "outputs": {"value": "$"}},
+                {"id": "header", "action": "template", "template": "Bearer ${secret.value}",
+                 "outputs": {"text": "$"}},
+                {"id": "plain", "action": "template", "template": "public", "outputs": {"text": "$"}}
+            ],
+            "on_complete": {"action": "return", "value": "${header.text} ${plain.text}"}
+        })
+        result = runner.perform(action="run", workflow_name="secrets")
+        assert "`value`: ********" in result
+
+        with open(os.path.join(runner.step_cache_dir, "secrets.json"), "rb") as f:
+            raw = f.read()
+        assert b"s3cr3t" not in raw
+        assert set(json.loads(raw)["steps"]) == {"plain"}
+
+    def test_step_cache_invalidated_when_workflow_changes(self, runner):
+        workflow = {
+            "name": "Cached",
+            "variables": {"greeting": {"default": "hello"}},
+            "steps": [
+                {"id": "msg", "action": "template", "template": "${greeting}", "cache": True,
+                 "outputs": {"text": "$"}}
+            ],
+            "on_complete": {"action": "return", "value": "${msg.text}"}
+        }
+        path = self.write_workflow(runner, "cached", workflow)
+
+        assert "✅ Success\n" in runner.perform(action="run", workflow_name="cached")
+        assert "✅ Success (cached)" in runner.perform(action="run", workflow_name="cached")
+
+        workflow["name"] = "Cached v2"
+        self.write_workflow(runner, "cached", workflow)
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000_000))
+        result = runner.perform(action="run", workflow_name="cached")
+        assert "# 🚀 Running: Cached v2" in result
+        assert "✅ Success\n" in result
+        assert "(cached)" not in result
+
+    def test_resume_checks_inputs_of_skipped_steps(self, runner):
+        self.write_workflow(runner, "resume", {
+            "variables": {"greeting": {"default": "hello"}},
+            "steps": [
+                {"id": "first", "action": "template", "template": "${greeting}", "outputs": {"text": "$"}},
+                {"id": "second", "action": "template", "template": "${first.text}!", "outputs": {"text": "$"}}
+            ],
+            "on_complete": {"action": "return", "value": "${second.text}"}
+        })
+        assert runner.perform(action="run", workflow_name="resume").endswith("hello!")
+
+        result = runner.perform(action="run", workflow_name="resume", start_from_step="second")
+        assert "⏭️ Skipping: first (reusing last run's outputs)" in result
+        assert result.endswith("hello!")
+
+        result = runner.perform(action="run", workflow_name="resume", start_from_step="second",
+                                variables={"greeting": "bye"})
+        assert result.startswith("Error: cannot resume from 'second': step 'first' last ran with different inputs")
+
+
+class TestIQBoosterAgent:
+    """Tests for IQBoosterAgent lookups, the on-disk cache and auto boost"""
+
+    @pytest.fixture
+    def iq(self, tmp_path, monkeypatch):
+        import agents.iq_booster_agent as iq
+        monkeypatch.setattr(iq, "_CACHE_PATH", str(tmp_path / "cache" / "iqbooster_cache.json"))
+        monkeypatch.setattr(iq, "_CACHE_STATE", {"mtime": None, "data": {}})
+        monkeypatch.setattr(iq, "get_subscription_id", lambda: "sub-1")
+        monkeypatch.setattr(iq, "get_cs_client", lambda: None)
+        monkeypatch.setattr(iq, "get_web_client", lambda: None)
+        for name in ("AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_DEPLOYMENT_NAME", "AZURE_OPENAI_API_KEY"):
+            monkeypatch.delenv(name, raising=False)
+        return iq
+
+    def make_account(self, name, kind="OpenAI"):
+        account = Mock(kind=kind, location="eastus")
+        account.name = name
+        account.id = f"/subscriptions/sub-1/resourceGroups/rg-{name}/providers/Microsoft.CognitiveServices/accounts/{name}"
+        account.properties.endpoint = f"https://{name}.openai.azure.com/"
+        return account
+
+    def test_list_accounts_uses_sdk_client(self, iq, monkeypatch):
+        client = Mock()
+        client.accounts.list.return_value = [self.make_account("acct"), self.make_account("speech", kind="SpeechServices")]
+        monkeypatch.setattr(iq, "get_cs_client", lambda: client)
+        agent = iq.IQBoosterAgent()
+
+        with patch.object(agent, "_run_az_tsv") as run_az_tsv:
+            accounts = agent._list_openai_accounts()
+
+        run_az_tsv.assert_not_called()
+        assert accounts == [{
+            "name": "acct",
+            "location": "eastus",
+            "resourceGroup": "rg-acct",
+            "endpoint": "https://acct.openai.azure.com/"
+        }]
+
+    def test_list_accounts_falls_back_to_cli(self, iq):
+        agent = iq.IQBoosterAgent()
+        row = ["acct", "eastus", "rg", "https://acct.openai.azure.com/"]
+
+        with patch.object(agent, "_run_az_tsv", return_value=[row]) as run_az_tsv:
+            accounts = agent._list_openai_accounts()
+
+        assert run_az_tsv.call_args[0][0][:3] == ["cognitiveservices", "account", "list"]
+        assert accounts == [dict(zip(("name", "location", "resourceGroup", "endpoint"), row))]
+
+    def test_cached_lookup_persists_per_subscription(self, iq, monkeypatch):
+        agent = iq.IQBoosterAgent()
+        with patch.object(agent, "_run_az_list", return_value=[{"name": "gpt-4o"}]) as run_az_list:
+            assert agent._list_account_models("rg", "acct") == [{"name": "gpt-4o"}]
+            # A fresh process state still finds the entry on disk
+            monkeypatch.setattr(iq, "_CACHE_STATE", {"mtime": None, "data": {}})
+            assert iq.IQBoosterAgent()._list_account_models("rg", "acct") == [{"name": "gpt-4o"}]
+            assert run_az_list.call_count == 1
+
+            monkeypatch.setattr(iq, "get_subscription_id", lambda: "sub-2")
+            agent._list_account_models("rg", "acct")
+            assert run_az_list.call_count == 2
+
+        with open(iq._CACHE_PATH) as f:
+            assert set(json.load(f)) == {"sub-1|_list_account_models|rg|acct", "sub-2|_list_account_models|rg|acct"}
+
+    def test_create_deployment_invalidates_cached_deployments(self, iq):
+        agent = iq.IQBoosterAgent()
+        with patch.object(agent, "_run_az_list", side_effect=[[], [{"name": "chat"}]]) as run_az_list, \
+                patch.object(agent, "_run_az") as run_az:
+            assert agent._list_account_deployments("rg", "acct") == []
+            assert agent._list_account_deployments("rg", "acct") == []
+            agent._create_deployment("rg", "acct", "chat", "gpt-4o")
+            assert agent._list_account_deployments("rg", "acct") == [{"name": "chat"}]
+
+        assert run_az.call_args[0][0][:4] == ["cognitiveservices", "account", "deployment", "create"]
+        assert run_az_list.call_count == 2
+
+    def test_get_account_key_empty_cli_output(self, iq):
+        agent = iq.IQBoosterAgent()
+        with patch.object(agent, "_run_az_tsv", return_value=[]):
+            assert agent._get_account_key("rg", "acct") is None
+        with patch.object(agent, "_run_az_tsv", return_value=[["key-123"]]):
+            assert agent._get_account_key("rg", "acct") == "key-123"
+
+    @pytest.mark.parametrize("output,expected", [
+        ('[{"name": "a"}, {"name": "b"}]', [{"name": "a"}, {"name": "b"}]),
+        ("[]", []),
+        ("", []),
+    ])
+    def test_run_az_list_parses_items(self, iq, monkeypatch, output, expected):
+        # python -c stands in for az; the trailing --output json lands in sys.argv
+        monkeypatch.setattr(iq, "_AZ_BIN", sys.executable)
+        code = f"import sys; sys.stdout.write({output!r})"
+        assert iq.IQBoosterAgent()._run_az_list(["-c", code]) == expected
+
+    def test_run_az_list_reports_garbled_output(self, iq, monkeypatch):
+        monkeypatch.setattr(iq, "_AZ_BIN", sys.executable)
+        with pytest.raises(RuntimeError, match="Could not parse az output"):
+            iq.IQBoosterAgent()._run_az_list(["-c", "print('[{\"name\": ')"])
+
+    def test_update_app_settings_merges_with_sdk_client(self, iq, monkeypatch):
+        client = Mock()
+        client.web_apps.list_application_settings.return_value = Mock(properties={"KEEP": "1", "AZURE_OPENAI_API_KEY": "old"})
+        monkeypatch.setattr(iq, "get_web_client", lambda: client)
+
+        iq.IQBoosterAgent()._update_app_settings("rg", "app", {"AZURE_OPENAI_API_KEY": "new"})
+
+        resource_group, name, app_settings = client.web_apps.update_application_settings.call_args[0]
+        assert (resource_group, name) == ("rg", "app")
+        assert app_settings.properties == {"KEEP": "1", "AZURE_OPENAI_API_KEY": "new"}
+
+    def test_update_app_settings_passes_settings_file_to_cli(self, iq):
+        agent = iq.IQBoosterAgent()
+        seen = {}
+
+        def run_az_quiet(args, timeout=30):
+            with open(args[args.index("--settings") + 1][1:]) as f:
+                seen["settings"] = json.load(f)
+
+        with patch.object(agent, "_run_az_quiet", side_effect=run_az_quiet):
+            agent._update_app_settings("rg", "app", {"AZURE_OPENAI_API_KEY": "secret"})
+
+        assert seen["settings"] == [{"name": "AZURE_OPENAI_API_KEY", "value": "secret", "slotSetting": False}]
+
+    def test_update_settings_file_creates_and_merges(self, iq, tmp_path):
+        path = str(tmp_path / "local.settings.json")
+
+        previous, changed = iq._update_settings_file(path, {"A": "1"})
+        assert (previous, changed) == ({}, True)
+        assert iq._read_settings_file(path) == {"IsEncrypted": False, "Values": {"A": "1"}}
+
+        previous, changed = iq._update_settings_file(path, {"B": "2"})
+        assert (previous, changed) == ({"A": "1"}, True)
+        with open(path) as f:
+            assert f.read() == json.dumps({"IsEncrypted": False, "Values": {"A": "1", "B": "2"}}, indent=2)
+        assert not os.path.exists(path + ".tmp")
+
+    def test_update_settings_file_skips_unchanged_write(self, iq, tmp_path):
+        path = str(tmp_path / "local.settings.json")
+        iq._update_settings_file(path, {"A": "1"})
+
+        with patch.object(iq, "_write_settings_file") as write_settings_file:
+            previous, changed = iq._update_settings_file(path, {"A": "1"})
+
+        write_settings_file.assert_not_called()
+        assert (previous, changed) == ({"A": "1"}, False)
+
+    def test_model_rank(self, iq):
+        assert iq._model_rank("gpt-5-chat") == 0
+        assert iq._model_rank("GPT-4o-mini") == iq._model_rank("gpt-4o")
+        assert iq._model_rank("gpt-4o") < iq._model_rank("gpt-4-turbo") < iq._model_rank("gpt-4")
+        assert iq._model_rank("llama-3") == len(iq._PRIORITY_MODELS)
+
+    def test_auto_boost_picks_best_ranked_deployment(self, iq, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        agent = iq.IQBoosterAgent()
+        resources = [
+            {"name": name, "location": "eastus", "resourceGroup": "rg", "endpoint": f"https://{name}.openai.azure.com/"}
+            for name in ("first", "second", "third")
+        ]
+        deployments = {
+            "first": [{"name": "old", "properties": {"model": {"name": "gpt-4"}}}],
+            "second": [{"name": "chat", "properties": {"model": {"name": "gpt-4o"}}}],
+            "third": [{"name": "chat-too", "properties": {"model": {"name": "gpt-4o-mini"}}},
+                      {"name": "other", "properties": {"model": {"name": "llama-3"}}}]
+        }
+
+        with patch.object(agent, "_list_openai_accounts", return_value=resources), \
+                patch.object(agent, "_list_account_deployments", side_effect=lambda rg, name: deployments[name]), \
+                patch.object(agent, "_get_account_key", side_effect=lambda rg, name: f"key-{name}-0123456789") as get_account_key, \
+                patch.object(agent, "_update_app_settings") as update_app_settings:
+            result = agent._auto_boost({"function_app_name": "app", "resource_group": "rg"})
+
+        # Only the winning resource's key is fetched
+        get_account_key.assert_called_once_with("rg", "second")
+
+        # gpt-4o ties with gpt-4o-mini; the earlier resource wins
+        assert "**Best Model Found:** `gpt-4o` (deployment: `chat`)" in result
+        expected = {
+            "AZURE_OPENAI_ENDPOINT": "https://second.openai.azure.com/",
+            "AZURE_OPENAI_DEPLOYMENT_NAME": "chat",
+            "AZURE_OPENAI_API_KEY": "key-second-0123456789"
+        }
+        update_app_settings.assert_called_once_with("rg", "app", expected)
+        assert iq._read_settings_file("local.settings.json")["Values"] == expected
+
+    def test_auto_boost_without_ranked_models(self, iq):
+        agent = iq.IQBoosterAgent()
+        resources = [{"name": "acct", "location": "eastus", "resourceGroup": "rg", "endpoint": "https://acct/"}]
+
+        with patch.object(agent, "_list_openai_accounts", return_value=resources), \
+                patch.object(agent, "_list_account_deployments", return_value=[]), \
+                patch.object(agent, "_get_account_key", return_value="key"), \
+                patch.object(agent, "_update_app_settings") as update_app_settings:
+            result = agent._auto_boost({})
+
+        assert "No deployable models found" in result
+        update_app_settings.assert_not_called()
+
+    def test_auto_boost_stops_without_api_key(self, iq):
+        agent = iq.IQBoosterAgent()
+        resources = [{"name": "acct", "location": "eastus", "resourceGroup": "rg", "endpoint": "https://acct/"}]
+        deployments = [{"name": "chat", "properties": {"model": {"name": "gpt-4o"}}}]
+
+        with patch.object(agent, "_list_openai_accounts", return_value=resources), \
+                patch.object(agent, "_list_account_deployments", return_value=deployments), \
+                patch.object(agent, "_get_account_key", return_value=None), \
+                patch.object(agent, "_update_app_settings") as update_app_settings:
+            result = agent._auto_boost({})
+
+        assert result.endswith("❌ Error getting API key: no key returned for acct")
+        update_app_settings.assert_not_called()
+
+
+class TestAzureClients:
+    """Tests for the shared Azure SDK client helpers"""
+
+    @pytest.fixture(autouse=True)
+    def clear_caches(self):
+        from utils import azure_clients
+        azure_clients._ARM_CONTEXTS.clear()
+        azure_clients._ARM_FAILURES.clear()
+        azure_clients._mgmt_client.cache_clear()
+        yield
+        azure_clients._ARM_CONTEXTS.clear()
+        azure_clients._ARM_FAILURES.clear()
+        azure_clients._mgmt_client.cache_clear()
+
+    def test_get_arm_context_shares_credential_and_transport(self):
+        from azure.core.pipeline.transport import RequestsTransport
+        from utils import azure_clients
+        credential = Mock()
+
+        with patch.object(azure_clients, "get_credential", return_value=credential), \
+                patch.object(azure_clients, "get_subscription_id", return_value="sub-1"):
+            context = azure_clients.get_arm_context()
+            assert azure_clients.get_arm_context() is context
+
+        assert context[:2] == (credential, "sub-1")
+        assert isinstance(context[2], RequestsTransport)
+        credential.get_token.assert_called_once_with("https://management.azure.com/.default")
+
+    def test_get_arm_context_none_when_token_fails(self):
+        from utils import azure_clients
+        credential = Mock()
+        credential.get_token.side_effect = Exception("not logged in")
+
+        with patch.object(azure_clients, "get_credential", return_value=credential), \
+                patch.object(azure_clients, "get_subscription_id", return_value="sub-1"):
+            assert azure_clients.get_arm_context() is None
+
+    def test_get_arm_context_retries_failed_setup(self, monkeypatch):
+        from utils import azure_clients
+        credential = Mock()
+        credential.get_token.side_effect = [Exception("not logged in"), Mock()]
+
+        with patch.object(azure_clients, "get_credential", return_value=credential), \
+                patch.object(azure_clients, "get_subscription_id", return_value="sub-1"):
+            assert azure_clients.get_arm_context() is None
+            # The failure is remembered briefly rather than retried on every call
+            assert azure_clients.get_arm_context() is None
+            assert credential.get_token.call_count == 1
+
+            monkeypatch.setattr(azure_clients, "_SETUP_RETRY_INTERVAL", 0)
+            context = azure_clients.get_arm_context()
+
+        assert context is not None and context[1] == "sub-1"
+        assert credential.get_token.call_count == 2
+
+    def test_get_arm_context_none_without_subscription(self):
+        from utils import azure_clients
+
+        with patch.object(azure_clients, "get_credential") as get_credential, \
+                patch.object(azure_clients, "get_subscription_id", return_value=None):
+            assert azure_clients.get_arm_context() is None
+        get_credential.assert_not_called()
+
+    def test_get_cs_client_reused_per_subscription(self):
+        from utils import azure_clients
+        credential = Mock()
+
+        with patch.object(azure_clients, "get_credential", return_value=credential), \
+                patch.object(azure_clients, "get_subscription_id", return_value="sub-1"):
+            client = azure_clients.get_cs_client()
+            assert azure_clients.get_cs_client() is client
+
+        assert client._config.subscription_id == "sub-1"
+
+    def test_get_subscription_id_prefers_env_var(self, monkeypatch):
+        from utils.azure_clients import get_subscription_id
+        monkeypatch.setenv("AZURE_SUBSCRIPTION_ID", "env-sub")
+        assert get_subscription_id() == "env-sub"
+
+    def test_get_subscription_id_reads_cli_default(self, tmp_path, monkeypatch):
+        from utils.azure_clients import get_subscription_id
+        monkeypatch.delenv("AZURE_SUBSCRIPTION_ID", raising=False)
+        monkeypatch.setenv("AZURE_CONFIG_DIR", str(tmp_path))
+        assert get_subscription_id() is None
+
+        profile = {"subscriptions": [{"id": "other", "isDefault": False}, {"id": "cli-sub", "isDefault": True}]}
+        (tmp_path / "azureProfile.json").write_text(json.dumps(profile), encoding="utf-8-sig")
+        assert get_subscription_id() == "cli-sub"
+
+    def test_get_cli_default_subscription_logged_out(self, tmp_path, monkeypatch):
+        from utils.azure_clients import get_cli_default_subscription
+        monkeypatch.setenv("AZURE_CONFIG_DIR", str(tmp_path))
+        (tmp_path / "azureProfile.json").write_text(json.dumps({"subscriptions": []}), encoding="utf-8-sig")
+        assert get_cli_default_subscription() == {}
+
+
+class TestContextAnalyzerAgent:
+    """Tests for the ContextAnalyzer /context display"""
+
+    @pytest.fixture
+    def analyzer(self, monkeypatch):
+        import agents.context_analyzer_agent as context_analyzer
+        from utils.tokenizer import CalibratedTokenizer
+        monkeypatch.setattr(context_analyzer, "_AGENT_CACHE", {"key": None, "value": None, "ts": 0.0})
+        monkeypatch.setattr(context_analyzer, "_STORAGE_LIST_CACHE", {})
+        monkeypatch.setenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4o")
+        return context_analyzer.ContextAnalyzerAgent(tokenizer=CalibratedTokenizer())
+
+    def make_storage(self, memory_size):
+        cloud_agent = Mock()
+        cloud_agent.name = "cloud_helper_agent.py"
+        storage = Mock()
+        storage.list_files.return_value = [cloud_agent]
+        storage.get_memory_size.return_value = memory_size
+        return storage
+
+    def test_full_view_reads_storage_and_history(self, analyzer):
+        storage = self.make_storage(4002)
+        history = [
+            {"role": "user", "content": "Hello"},
+            {"role": "assistant", "content": "Hi there"},
+            {"role": "user", "content": {"text": "structured"}}
+        ]
+
+        with patch.object(analyzer, "_get_storage", return_value=storage):
+            result = analyzer.perform(conversation_history=history, user_guid="user-1")
+
+        storage.set_memory_context.assert_called_once_with("user-1")
+        assert "gpt-4o · " in result and "/128.0k tokens" in result
+        assert "├─ Cloud Helper (cloud): ~500 tokens" in result
+        assert "└─ User memory: 1.0k tokens" in result
+        assert "├─ 👤 User messages:      2" in result
+        assert "└─ Total: 3 messages" in result
+
+    def test_repeated_calls_reflect_memory_changes(self, analyzer):
+        storage = self.make_storage(2)
+
+        with patch.object(analyzer, "_get_storage", return_value=storage):
+            assert "└─ No memory loaded" in analyzer.perform(user_guid="user-1")
+            storage.get_memory_size.return_value = 8002
+            assert "└─ User memory: 2.0k tokens" in analyzer.perform(user_guid="user-1")
+
+    def test_summary_view_skips_storage(self, analyzer):
+        with patch.object(analyzer, "_get_storage") as get_storage:
+            result = analyzer.perform(detail="summary", conversation_history=[{"role": "user", "content": "Hi"}])
+
+        get_storage.assert_not_called()
+        assert "Summary view · memory not measured" in result
+        assert "🟨 Messages:" in result
+        assert "Agent Tools" not in result
+        assert "Messages\n" not in result
+
+    def grid_cells(self, analyzer, snap):
+        lines = list(analyzer._iter_context_display(snap))
+        rows = [line.split()[0] for line in lines[3:7]]
+        return rows, Counter(cell for row in rows for cell in row)
+
+    def test_grid_apportions_blocks_by_share(self, analyzer):
+        from agents.context_analyzer_agent import ContextSnapshot
+        snap = ContextSnapshot(model_name="m", max_tokens=1000, sys_tokens=250, tool_tokens=250)
+
+        rows, cells = self.grid_cells(analyzer, snap)
+
+        assert all(len(row) == 10 for row in rows)
+        # 25% / 25% used, 35% free after the 15% buffer
+        assert cells == {"🟦": 10, "🟧": 10, "⬜": 14, "⬛": 6}
+
+    @pytest.mark.parametrize("max_tokens,tokens", [
+        (128000, (517, 3500, 1, 0)),
+        (1000, (333, 333, 333, 1)),
+        (1000, (900, 900, 900, 900)),
+        (0, (10, 10, 10, 10)),
+    ])
+    def test_grid_always_has_forty_cells(self, analyzer, max_tokens, tokens):
+        from agents.context_analyzer_agent import ContextSnapshot
+        sys_tokens, tool_tokens, mem_tokens, msg_tokens = tokens
+        snap = ContextSnapshot(model_name="m", max_tokens=max_tokens, sys_tokens=sys_tokens,
+                               tool_tokens=tool_tokens, mem_tokens=mem_tokens, msg_tokens=msg_tokens)
+
+        rows, cells = self.grid_cells(analyzer, snap)
+
+        assert all(len(row) == 10 for row in rows)
+        assert sum(cells.values()) == 40
+
+
 # Fixtures
 @pytest.fixture
 def mock_env_vars():
@@ -0,0 +1,236 @@
+"""
+Azure Client Helpers
+
+Shared, lazily created Azure SDK clients. Every client reuses one credential
+(and so one token cache), and the management clients for a subscription
+share one keep-alive HTTP session to management.azure.com. Each getter
+returns None when the SDK it needs is not installed, so callers can fall
+back to the az CLI.
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+# Refresh a shared ARM token this many seconds before it expires
+_TOKEN_REFRESH_MARGIN = 300
+
+_ARM_SCOPE = 'https://management.azure.com/.default'
+
+# Seconds before a failed SDK setup is tried again instead of using the CLI
+_SETUP_RETRY_INTERVAL = 60
+
+# ARM contexts keyed by subscription, and when setup last failed for one
+_ARM_LOCK = threading.Lock()
+_ARM_CONTEXTS = {}
+_ARM_FAILURES = {}
+
+# Default subscription entry parsed from azureProfile.json, keyed by (path, mtime)
+_PROFILE_LOCK = threading.Lock()
+_PROFILE_STATE = {'key': None, 'value': None}
+
+
+class _SharedTokenCredential:
+    """
+    Wraps a credential so every ARM client in the process shares its tokens.
+
+    Each SDK client otherwise caches its own token, which with the Azure CLI
+    credential means one `az account get-access-token` per client.
+    """
+
+    def __init__(self, credential):
+        self._credential = credential
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get_token(self, *scopes, **kwargs):
+        if kwargs:
+            # Claims challenges and tenant overrides must bypass the cache
+            return self._credential.get_token(*scopes, **kwargs)
+        with self._lock:
+            token = self._tokens.get(scopes)
+            if token is None or token.expires_on - time.time() < _TOKEN_REFRESH_MARGIN:
+                token = self._credential.get_token(*scopes)
+                self._tokens[scopes] = token
+            return token
+
+
+@functools.lru_cache(maxsize=1)
+def get_credential():
+    """
+    Get the process-wide DefaultAzureCredential, wrapped to share its tokens.
+
+    Returns None when azure-identity is not installed.
+    """
+    try:
+        from azure.identity import DefaultAzureCredential
+    except ImportError:
+        return None
+    return _SharedTokenCredential(DefaultAzureCredential())
+
+
+def get_cli_default_subscription():
+    """
+    Get the az CLI's default subscription entry from azureProfile.json.
+
+    Reads the file directly, avoiding the az start-up, and re-reads it only
+    when it changes so an `az account set` is picked up. Returns the entry
+    (id, name, user, ...), {} when no subscription is selected (logged out),
+    or None when there is no readable profile.
+    """
+    config_dir = os.environ.get('AZURE_CONFIG_DIR') or os.path.expanduser('~/.azure')
+    profile_path = os.path.join(config_dir, 'azureProfile.json')
+    try:
+        mtime_ns = os.stat(profile_path).st_mtime_ns
+    except OSError:
+        return None
+
+    with _PROFILE_LOCK:
+        if _PROFILE_STATE['key'] != (profile_path, mtime_ns):
+            try:
+                # The CLI writes this file with a UTF-8 BOM
+                with open(profile_path, encoding='utf-8-sig') as f:
+                    subscriptions = json.load(f).get('subscriptions', [])
+                _PROFILE_STATE['value'] = next((sub for sub in subscriptions if sub.get('isDefault')), {})
+            except (OSError, ValueError, AttributeError) as e:
+                logging.debug(f"Could not read {profile_path}: {e}")
+                _PROFILE_STATE['value'] = None
+            _PROFILE_STATE['key'] = (profile_path, mtime_ns)
+        return _PROFILE_STATE['value']
+
+
+def get_subscription_id():
+    """
+    Resolve the subscription to manage, the same one the az CLI would use.
+
+    AZURE_SUBSCRIPTION_ID wins; otherwise the CLI's default subscription.
+    Returns None when neither is available.
+    """
+    subscription_id = os.environ.get('AZURE_SUBSCRIPTION_ID')
+    if subscription_id:
+        return subscription_id
+    return (get_cli_default_subscription() or {}).get('id')
+
+
+def get_arm_context():
+    """
+    Get the (credential, subscription_id, transport) shared by the management clients.
+
+    All clients reuse one token cache and one keep-alive HTTP session to
+    management.azure.com, so only the first ARM call pays for token
+    acquisition and the TCP/TLS handshake.
+
+    Returns None when azure-identity is missing, no subscription can be
+    resolved or no token can be acquired, so callers fall back to the az CLI.
+    """
+    subscription_id = get_subscription_id()
+    if not subscription_id:
+        return None
+    return _arm_context(subscription_id)
+
+
+def _arm_context(subscription_id):
+    """
+    The shared context for a subscription, built on first use.
+
+    Only a successfully built context is kept. A failure (a call made before
+    `az login`, a network blip) is remembered for _SETUP_RETRY_INTERVAL
+    seconds so callers use the CLI meanwhile, then setup is tried again.
+    """
+    context = _ARM_CONTEXTS.get(subscription_id)
+    if context is not None:
+        return context
+    with _ARM_LOCK:
+        context = _ARM_CONTEXTS.get(subscription_id)
+        if context is not None:
+            return context
+        failed_at = _ARM_FAILURES.get(subscription_id)
+        if failed_at is not None and time.monotonic() - failed_at < _SETUP_RETRY_INTERVAL:
+            return None
+
+        context = _create_arm_context(subscription_id)
+        if context is None:
+            _ARM_FAILURES[subscription_id] = time.monotonic()
+        else:
+            _ARM_CONTEXTS[subscription_id] = context
+            _ARM_FAILURES.pop(subscription_id, None)
+        return context
+
+
+def _create_arm_context(subscription_id):
+    credential = get_credential()
+    if credential is None:
+        return None
+    try:
+        import requests
+        from azure.core.pipeline.transport import RequestsTransport
+    except ImportError:
+        return None
+
+    try:
+        # The session is owned here so the clients don't close it between calls
+        transport = RequestsTransport(session=requests.Session(), session_owner=False)
+        # Fail over to the CLI now rather than on the first management call
+        credential.get_token(_ARM_SCOPE)
+    except Exception as e:
+        logging.info(f"Azure SDK unavailable, using the az CLI: {e}")
+        return None
+    return credential, subscription_id, transport
+
+
+def _create_mgmt_client(client_class):
+    context = get_arm_context()
+    if context is None:
+        return None
+    return _mgmt_client(client_class, context)
+
+
+@functools.lru_cache(maxsize=None)
+def _mgmt_client(client_class, context):
+    """One client per class and subscription"""
+    credential, subscription_id, transport = context
+    return client_class(credential, subscription_id, transport=transport)
+
+
+def get_cs_client():
+    """
+    Get a shared Cognitive Services management client.
+
+    Returns None when the management SDK is not installed or no subscription
+    can be resolved, in which case callers fall back to the az CLI.
+    """
+    try:
+        from azure.mgmt.cognitiveservices import CognitiveServicesManagementClient
+    except ImportError:
+        return None
+    return _create_mgmt_client(CognitiveServicesManagementClient)
+
+
+def get_web_client():
+    """Get a shared App Service management client, or None to fall back to the az CLI"""
+    try:
+        from azure.mgmt.web import WebSiteManagementClient
+    except ImportError:
+        return None
+    return _create_mgmt_client(WebSiteManagementClient)
+
+
+def get_secret_client(vault_name):
+    """Get a shared Key Vault secrets client for a vault, or None to fall back to the az CLI"""
+    credential = get_credential()
+    if credential is None:
+        return None
+    try:
+        from azure.keyvault.secrets import SecretClient
+    except ImportError:
+        return None
+    return _secret_client(SecretClient, vault_name, credential)
+
+
+@functools.lru_cache(maxsize=None)
+def _secret_client(client_class, vault_name, credential):
+    """One client per vault; only built clients are cached"""
+    return client_class(f"https://{vault_name}.vault.azure.net", credential)
@@ -285,6 +285,26 @@ class AzureFileStorageManager:
             logging.error(f"Error reading from GUID memory: {str(e)}")
             raise  # Let read_json handle the fallback
 
+    def get_memory_size(self) -> int:
+        """
+        Get the size of the active memory file without downloading it.
+
+        Returns:
+            int: Size in bytes of the current memory file, 0 if it does not exist
+        """
+        if self.current_guid and self.current_memory_path != self.shared_memory_path:
+            file_path = f"{self.current_memory_path}/user_memory.json"
+        else:
+            file_path = f"{self.shared_memory_path}/{self.default_file_name}"
+        try:
+            file_client = self.share_client.get_file_client(file_path)
+            return file_client.get_file_properties().size or 0
+        except ResourceNotFoundError:
+            return 0
+        except Exception as e:
+            logging.error(f"Error getting memory size: {str(e)}")
+            return 0
+
     def write_json(self, data: dict):
         """Write to either GUID-specific memory or shared memories."""
         if self.current_guid and self.current_memory_path != self.shared_memory_path:
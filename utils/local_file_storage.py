@@ -191,6 +191,25 @@ class LocalFileStorageManager:
             logging.error(f"Error reading from GUID memory: {str(e)}")
             raise  # Let read_json handle the fallback
 
+    def get_memory_size(self) -> int:
+        """
+        Get the size of the active memory file without reading it.
+
+        Returns:
+            int: Size in bytes of the current memory file, 0 if it does not exist
+        """
+        if self.current_guid and self.current_memory_path != self.shared_memory_path:
+            file_path = self._get_full_path(self.current_memory_path, "user_memory.json")
+        else:
+            file_path = self._get_full_path(self.shared_memory_path, self.default_file_name)
+        try:
+            return os.path.getsize(file_path)
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            logging.error(f"Error getting memory size: {str(e)}")
+            return 0
+
     def write_json(self, data: dict):
         """Write to either GUID-specific memory or shared memories."""
         if self.current_guid and self.current_memory_path != self.shared_memory_path:
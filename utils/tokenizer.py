@@ -0,0 +1,179 @@
+"""
+Token Estimation Utilities
+
+Provides token counters used to estimate context usage without calling the
+model. Uses tiktoken for exact counts when it is installed, otherwise falls
+back to a characters-per-token estimate that calibrates itself against the
+real prompt_tokens reported by the OpenAI API.
+"""
+
+import logging
+import threading
+from typing import Any, Iterable, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Below this many items the NumPy call overhead outweighs the vectorized sum
+VECTORIZE_MIN_ITEMS = 256
+
+
+def structured_length(obj: Any) -> int:
+    """
+    Approximate the serialized length of a dict/list without serializing it.
+
+    Walks the structure and sums the string length of every key and leaf,
+    avoiding the throwaway string a json.dumps() round-trip would allocate.
+
+    Args:
+        obj: Parsed JSON-like value (dict, list, str, number, ...)
+
+    Returns:
+        int: Approximate character count
+    """
+    if isinstance(obj, str):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(len(str(k)) + structured_length(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sum(structured_length(item) for item in obj)
+    if obj is None:
+        return 0
+    return len(str(obj))
+
+
+class CalibratedTokenizer:
+    """
+    Character-based token estimator with an online-calibrated ratio.
+
+    Starts at the usual ~4 characters per token and keeps an exponential
+    moving average of the tokens-per-character ratio observed in real
+    API responses.
+    """
+
+    def __init__(self, tokens_per_char: float = 0.25, alpha: float = 0.2):
+        """
+        Initialize the tokenizer.
+
+        Args:
+            tokens_per_char: Initial tokens-per-character ratio
+            alpha: EMA smoothing factor applied on each calibration
+        """
+        self._tpc = tokens_per_char
+        self._alpha = alpha
+        self._lock = threading.Lock()
+
+    @property
+    def tokens_per_char(self) -> float:
+        return self._tpc
+
+    def count_text(self, text: str) -> int:
+        """Estimate the token count of a string."""
+        return max(1, int(len(text) * self._tpc))
+
+    def count_structured(self, obj: Any) -> int:
+        """Estimate the token count of a dict/list without serializing it."""
+        return max(1, int(structured_length(obj) * self._tpc))
+
+    def count_lengths(self, lengths: Iterable[int]) -> int:
+        """
+        Sum the token estimates for many texts given only their lengths.
+
+        Equivalent to summing count_text() per text, but vectorized with NumPy
+        for long inputs when it is installed.
+
+        Args:
+            lengths: Character length of each text
+        """
+        tpc = self._tpc
+        lengths = list(lengths)
+        if np is not None and len(lengths) >= VECTORIZE_MIN_ITEMS:
+            arr = np.fromiter(lengths, dtype=np.int64, count=len(lengths))
+            return int(np.maximum((arr * tpc).astype(np.int64), 1).sum())
+        return sum(max(1, int(n * tpc)) for n in lengths)
+
+    def calibrate(self, char_count: int, prompt_tokens: int) -> None:
+        """
+        Fold an observed (characters, prompt_tokens) pair into the ratio.
+
+        Args:
+            char_count: Characters sent in the prompt
+            prompt_tokens: prompt_tokens reported by the API for that prompt
+        """
+        if char_count <= 0 or prompt_tokens <= 0:
+            return
+        observed = prompt_tokens / char_count
+        with self._lock:
+            self._tpc += self._alpha * (observed - self._tpc)
+
+
+class TiktokenTokenizer:
+    """Exact token counter backed by tiktoken."""
+
+    def __init__(self, encoding):
+        self._encoding = encoding
+
+    def count_text(self, text: str) -> int:
+        """Count the tokens in a string."""
+        return max(1, len(self._encoding.encode(text)))
+
+    def count_structured(self, obj: Any) -> int:
+        """Count the tokens in the string leaves of a dict/list."""
+        total = 0
+        stack = [obj]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, dict):
+                total += sum(len(self._encoding.encode(str(k))) for k in item)
+                stack.extend(item.values())
+            elif isinstance(item, (list, tuple)):
+                stack.extend(item)
+            elif item is not None:
+                total += len(self._encoding.encode(item if isinstance(item, str) else str(item)))
+        return max(1, total)
+
+    def calibrate(self, char_count: int, prompt_tokens: int) -> None:
+        """Exact counts need no calibration."""
+
+
+_default_tokenizer = None
+_default_lock = threading.Lock()
+
+
+def get_default_tokenizer(model_name: Optional[str] = None):
+    """
+    Get the shared process-wide tokenizer.
+
+    Returns a TiktokenTokenizer when tiktoken is installed, otherwise a
+    CalibratedTokenizer. The instance is shared so calibration from API
+    responses benefits every caller.
+
+    Args:
+        model_name: Model used to pick the tiktoken encoding (first call only)
+    """
+    global _default_tokenizer
+    if _default_tokenizer is None:
+        with _default_lock:
+            if _default_tokenizer is None:
+                _default_tokenizer = _create_tokenizer(model_name)
+    return _default_tokenizer
+
+
+def _create_tokenizer(model_name: Optional[str]):
+    try:
+        import tiktoken
+    except ImportError:
+        return CalibratedTokenizer()
+
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model_name or 'gpt-4o')
+        except KeyError:
+            # Azure deployment names are arbitrary; use the GPT-4o/5 encoding
+            encoding = tiktoken.get_encoding('o200k_base')
+    except Exception as e:
+        logging.debug(f"Could not load tiktoken encoding: {e}")
+        return CalibratedTokenizer()
+    return TiktokenTokenizer(encoding)